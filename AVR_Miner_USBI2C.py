@@ -26,23 +26,31 @@ import json
 from locale import LC_ALL, getdefaultlocale, getlocale, setlocale
 
 from re import sub
-from socket import socket
+from random import choice, choices, uniform
+from socket import socket, create_connection
+from socket import timeout as socket_timeout
 from datetime import datetime
-from statistics import mean
 from signal import SIGINT, signal
-from time import ctime, sleep, strptime, time
+from time import ctime, sleep, strptime, time, perf_counter
 import pip
 
 from subprocess import DEVNULL, Popen, check_call, call
 from threading import Thread
 from threading import Lock as thread_lock
-from threading import Semaphore
+from threading import Semaphore, Condition, Event
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as future_timeout
+from collections import deque
+from heapq import heappush, heappop
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import base64 as b64
+import hashlib
+import asyncio
 
 import os
 printlock = Semaphore(value=1)
-serlock = Semaphore(value=1)
 
 # Python <3.5 check
 f"Your Python version is too old. Duino-Coin Miner requires version 3.6 or above. Update your packages and try again"
@@ -106,15 +114,139 @@ def port_num(com):
 class Settings:
     VER = '4.1'
     SOC_TIMEOUT = 15
+    SOC_RECV_SIZE = 1024
+    SOC_MAX_LINE = 4096
+    # quiet time after which a message without newline is taken as complete
+    SOC_SETTLE = 0.5
     REPORT_TIME = 60
     AVR_TIMEOUT = 10  # diff 16 * 100 / 269 h/s = 5.94 s
-    DELAY_START = 10  # 60 seconds start delay between worker to help kolka sync efficiency drop
+    DELAY_START = 10  # seconds the starts of a batch of workers are spread over to help kolka sync efficiency drop
+    ENGINE = "threaded"  # threaded - one thread per I2CS, asyncio - one coroutine per I2CS
+    JOB_PREFETCH = "n"  # fetch the next job on a second connection while the AVR is hashing
+    PREFETCH_MAX_AGE = 30  # seconds a prefetched job stays usable
+    METRICS_PORT = 0  # Prometheus metrics endpoint, 0 - disabled
+    METRICS_HOST = "127.0.0.1"
+    POOL_PICKER = "https://server.duinocoin.com/getPool"
+    # seconds the node from the picker is shared by reconnecting workers,
+    # a worker that failed on it may ask again after NODE_RETRY_TIME
+    NODE_TTL = 300
+    NODE_RETRY_TIME = 15
+    # nodes from earlier lookups used while the picker is down
+    NODE_FALLBACKS = 4
+    # extra nodes to rank, "host:port,host:port"
+    POOL_NODES = ""
+    # seconds between version banner probes of every known node, 0 off.
+    # A node scores its moving average banner RTT plus NODE_ERROR_PENALTY
+    # seconds times its failure rate. Workers move to a node scoring below
+    # NODE_SWITCH_RATIO of the current one, one every NODE_MIGRATE_INTERVAL
+    NODE_PROBE_INTERVAL = 60
+    NODE_PROBE_TIMEOUT = 5
+    NODE_ALPHA = 0.3
+    NODE_ERROR_PENALTY = 2
+    NODE_SWITCH_RATIO = 0.7
+    NODE_MIGRATE_INTERVAL = 1
     CRC8_EN = "y"
+    # recompute DUCO-S1 of every result before it is submitted
+    VERIFY_RESULTS = "y"
     BAUDRATE = 115200
     DATA_DIR = "Duino-Coin AVR Miner " + str(VER)
     SEPARATOR = ","
     USBI2C_SEPARATOR = ":"
     USBI2C_EOL = "$"
+    # adaptor firmware USB buffer is 128 chars, leave room for "127:b:" and "$"
+    USBI2C_BULK_MAX = 112
+    USBI2C_PROBE_TIMEOUT = 1
+    # Nano/Uno adaptors reset when the port opens, ver$ is repeated
+    # until the sketch is up for at most this many seconds
+    USBI2C_BOOT_TIME = 3
+    # longest I2CS response is "nonce,time,DUCOID...,crc8\n" ~ 45 chars
+    USBI2C_BURST_MAX = 64
+    # keep batched commands below the 64 byte serial RX buffer of AVR adaptors
+    USBI2C_BATCH_MAX = 48
+    # binary framing, used when the adaptor lists "bin" (firmware v0.5+)
+    USBI2C_BINARY = "y"
+    USBI2C_SOF = 0xA5
+    USBI2C_BIN_VERSION = 1
+    USBI2C_OP_WRITE = 1
+    USBI2C_OP_READ = 2
+    USBI2C_OP_FLUSH = 3
+    # startup link calibration, used when the adaptor lists "bd" (firmware
+    # v0.6+). Every rate of the ladder above usbi2c_baudrate is tried with
+    # an echo test, the adaptor goes back to the previous rate unless the
+    # host confirms the new one within BAUD_CONFIRM_TIMEOUT seconds
+    BAUD_CALIBRATE = "y"
+    BAUD_LADDER = (230400, 250000, 460800, 500000, 921600, 1000000, 2000000)
+    BAUD_CONFIRM_TIMEOUT = 1
+    BAUD_ECHO_ROUNDS = 8
+    BAUD_CACHE = "Calibration.json"
+    # Hz, set on adaptors that list "clk" (firmware v0.7+), older
+    # firmware runs at 100 kHz
+    I2C_CLOCK = 100000
+    # ~9 bits per byte at 100 kHz I2C clock, scaled by the clock in use
+    USBI2C_BYTE_TIME = 0.0001
+    USBI2C_FLUSH_TIME = 0.1
+    # after a failed batch, replies still on their way are read and
+    # dropped until the line is quiet for USBI2C_PROBE_TIMEOUT, at most
+    # this many seconds
+    USBI2C_DRAIN_MAX = 5
+    # bus scheduler phases, lower is served first
+    BUS_PRIO_LOAD = 0
+    BUS_PRIO_DRAIN = 1
+    BUS_PRIO_POLL = 2
+    BUS_PRIO_SCAN = 3
+    # feel free to play around this number to find sweet spot for shares/s vs. stability
+    POLL_INTERVAL = 0.05
+    # once the hashrate of an I2CS is known its result is polled
+    # predictively: the bus stays quiet for POLL_QUIET of the expected
+    # hashing time, then polls every POLL_INTERVAL_MIN backing off by
+    # POLL_BACKOFF up to POLL_INTERVAL_MAX
+    POLL_QUIET = 0.2
+    POLL_INTERVAL_MIN = 0.02
+    POLL_INTERVAL_MAX = 0.1
+    POLL_BACKOFF = 1.25
+    # number of latest shares the per I2CS hashrate and ping average over
+    HASHRATE_WINDOW = 5
+    PING_WINDOW = 10
+    # I2CS health score, the moving average of the fault of every job
+    # attempt: 1 for a failed read (retry, CRC8 error, timeout),
+    # HEALTH_REJECT_FAULT for a rejected share, 0 for an accepted one
+    HEALTH_ALPHA = 0.2
+    HEALTH_REJECT_FAULT = 0.5
+    HEALTH_DEGRADED = 0.25
+    HEALTH_RECOVERED = 0.1
+    HEALTH_QUARANTINE = 0.6
+    # pause between attempts of a degraded I2CS, doubles per failure
+    HEALTH_BACKOFF_MIN = 0.25
+    HEALTH_BACKOFF_MAX = 8
+    # seconds off the bus before a quarantined I2CS is probed again,
+    # doubles per quarantine until the I2CS is healthy again
+    QUARANTINE_TIME = 60
+    QUARANTINE_MAX = 960
+    # workers start in batches of RAMP_BATCH, doubling once every worker
+    # of the previous batch has its first job loaded (or RAMP_SETTLE_MAX
+    # seconds passed) while the adaptors stay below RAMP_BUS_MAX busy and
+    # the job round trip of the pool below RAMP_POOL_SLOWDOWN times that
+    # of the first batch, halving otherwise
+    RAMP_BATCH = 4
+    RAMP_SETTLE_MAX = 30
+    RAMP_BUS_MAX = 0.7
+    RAMP_POOL_SLOWDOWN = 2
+    # seconds between background bus scans of every adaptor, 0 turns
+    # hot-plug off. A configured I2CS missing from TOPOLOGY_MISSES scans
+    # in a row is parked until it is back, a new address starts a worker
+    TOPOLOGY_INTERVAL = 30
+    TOPOLOGY_MISSES = 2
+    # seconds to wait for a bus scan, scans have the lowest priority and
+    # a saturated bus may not serve them for long. The scan stays queued
+    # and counts as not answered yet
+    SCAN_TIMEOUT = 5
+    # seconds before a worker that failed outside the share retries
+    # (e.g. on a serial error of its adaptor) is started again
+    WORKER_RESTART_TIME = 10
+    # share phases timed per I2CS and the histogram bucket bounds in seconds
+    PHASES = ("job", "upload", "first_byte", "drain", "crc", "submit")
+    LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1,
+                       0.2, 0.5, 1, 2, 5, 10, 20)
     ENCODING = "utf-8"
     try:
         # Raspberry Pi latin users can't display this character
@@ -220,17 +352,87 @@ class Client:
         sent = s.sendall(str(msg).encode(Settings.ENCODING))
         return True
 
-    def recv(s, limit: int = 128):
-        data = s.recv(limit).decode(Settings.ENCODING).rstrip("\n")
-        return data
+    def fetch_pool(stale=None):
+        """
+        Node to connect to, stale is the node the caller failed on
+        """
+        return node_resolver.resolve(stale)
+
 
-    def fetch_pool():
+class NodeResolver:
+    """
+    Process wide node lookup shared by every worker. The last node
+    from the picker is cached for NODE_TTL seconds and only one
+    caller asks the picker at a time, the others wait for its answer,
+    so a node going down costs one lookup instead of one per worker.
+    Nodes of earlier lookups are kept as fallbacks for when the
+    picker is down.
+
+    A probe thread ranks the known nodes by version banner RTT and
+    failure rate and selects a clearly better one, workers then
+    move over to it one at a time at the end of a share
+    """
+    def __init__(self):
+        self.cond = Condition()
+        self.node = None
+        self.fetched_at = 0
+        self.resolving = False
+        self.generation = 0
+        self.fallbacks = deque(maxlen=Settings.NODE_FALLBACKS)
+        self.scores = {}
+        self.migrate_at = 0
+        # (selected node, ((node, rtt, errors), ...)) for metrics
+        # scrapes, replaced as a whole so it is read without the lock
+        self.published = (None, ())
+
+    def resolve(self, stale=None):
+        with self.cond:
+            waited = False
+            while self.resolving:
+                generation = self.generation
+                self.cond.wait_for(lambda: self.generation != generation)
+                waited = True
+            age = time() - self.fetched_at
+            if stale:
+                self.score(stale).add(None)
+                self.publish()
+            if self.node and (waited or (
+                    age < Settings.NODE_TTL
+                    and (self.node != stale
+                         or age < Settings.NODE_RETRY_TIME))):
+                return self.node
+            self.resolving = True
+
+        node = None
+        try:
+            node = self.fetch(stale)
+        finally:
+            with self.cond:
+                if node:
+                    self.node = node
+                    self.fetched_at = time()
+                self.resolving = False
+                self.generation += 1
+                self.publish()
+                self.cond.notify_all()
+        return node
+
+    def fallback(self, stale):
+        # least recently tried node of earlier lookups
+        if stale in self.fallbacks:
+            self.fallbacks.remove(stale)
+            self.fallbacks.append(stale)
+        if self.fallbacks and self.fallbacks[0] != stale:
+            return self.fallbacks[0]
+        return None
+
+    def fetch(self, stale):
         while True:
             pretty_print("net0", " " + get_string("connection_search"),
                          "info")
             try:
                 response = requests.get(
-                    "https://server.duinocoin.com/getPool",
+                    Settings.POOL_PICKER,
                     timeout=10).json()
 
                 if response["success"] == True:
@@ -238,15 +440,16 @@ class Client:
                                  + response["name"],
                                  "info")
 
-                    NODE_ADDRESS = response["ip"]
-                    NODE_PORT = response["port"]
+                    node = (response["ip"], response["port"])
                     debug_output(f"Fetched pool: {response['name']}")
-                    return (NODE_ADDRESS, NODE_PORT)
+                    if node in self.fallbacks:
+                        self.fallbacks.remove(node)
+                    self.fallbacks.appendleft(node)
+                    return node
 
                 elif "message" in response:
-                    pretty_print(f"Warning: {response['message']}"
-                                 + ", retrying in 15s", "warning", "net0")
-                    sleep(15)
+                    pretty_print("net0", f" Warning: {response['message']}"
+                                 + ", retrying in 15s", "warning")
                 else:
                     raise Exception(
                         "no response - IP ban or connection error")
@@ -259,7 +462,208 @@ class Client:
                     pretty_print("net0", get_string("node_picker_error")
                                  + f"15s {Style.RESET_ALL}({e})",
                                  "error")
-                sleep(15)
+
+            node = self.fallback(stale)
+            if node:
+                pretty_print("net0", f" Using fallback node {node[0]}:"
+                             + f"{node[1]}", "warning")
+                return node
+            sleep(15)
+
+    def score(self, node):
+        # callers may hold cond already, its lock is reentrant
+        with self.cond:
+            if node not in self.scores:
+                self.scores[node] = NodeScore()
+            return self.scores[node]
+
+    def publish(self):
+        # caller holds cond
+        nodes = []
+        for node in self.candidates():
+            # get() so publishing never adds nodes to the scores
+            score = self.scores.get(node)
+            if score is not None:
+                nodes.append((node, score.rtt, score.errors))
+        self.published = (self.node, tuple(nodes))
+
+    def candidates(self):
+        with self.cond:
+            nodes = list(self.fallbacks)
+        for item in Settings.POOL_NODES.split(","):
+            host, _, port = item.strip().rpartition(":")
+            if host and port.isdigit() and (host, int(port)) not in nodes:
+                nodes.append((host, int(port)))
+        if self.node and self.node not in nodes:
+            nodes.append(self.node)
+        return nodes
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        while True:
+            sleep(Settings.NODE_PROBE_INTERVAL)
+            for node in self.candidates():
+                rtt = probe_node(node)
+                with self.cond:
+                    self.score(node).add(rtt)
+            self.select()
+            with self.cond:
+                self.publish()
+
+    def select(self):
+        with self.cond:
+            if self.node is None or self.resolving:
+                return
+            current = self.score(self.node).value()
+            best = min(self.candidates(),
+                       key=lambda node: (self.score(node).value() is None,
+                                         self.score(node).value() or 0))
+            value = self.score(best).value()
+            if (best == self.node or value is None or (
+                    current is not None
+                    and value >= current * Settings.NODE_SWITCH_RATIO)):
+                return
+            pretty_print("net0", f" Switching to node {best[0]}:{best[1]}"
+                         + f" (score {value * 1000:.0f}ms, was "
+                         + (f"{current * 1000:.0f}ms)" if current is not None
+                            else "unreachable)"),
+                         "info")
+            self.node = best
+            self.fetched_at = time()
+
+    def migrate(self, node):
+        """
+        True when the worker on node should reconnect to self.node,
+        lets one worker move per NODE_MIGRATE_INTERVAL
+        """
+        with self.cond:
+            if self.node is None or node == self.node:
+                return False
+            if time() < self.migrate_at:
+                return False
+            self.migrate_at = time() + Settings.NODE_MIGRATE_INTERVAL
+            return True
+
+
+class NodeScore:
+    """
+    Moving averages of the version banner RTT and the failure
+    rate of one node
+    """
+    __slots__ = ("rtt", "errors", "probes")
+
+    def __init__(self):
+        self.rtt = None
+        self.errors = 0
+        self.probes = 0
+
+    def add(self, rtt):
+        # rtt in seconds, None for a failed probe or connection
+        self.probes += 1
+        self.errors += ((rtt is None) - self.errors) * Settings.NODE_ALPHA
+        if rtt is not None:
+            self.rtt = (rtt if self.rtt is None
+                        else self.rtt + (rtt - self.rtt) * Settings.NODE_ALPHA)
+
+    def value(self):
+        # lower is better, None until a probe got through
+        if self.rtt is None:
+            return None
+        return self.rtt + self.errors * Settings.NODE_ERROR_PENALTY
+
+
+def probe_node(node):
+    """
+    Seconds from connecting to the version banner of the node,
+    None when it failed
+    """
+    start = perf_counter()
+    try:
+        s = create_connection(node, Settings.NODE_PROBE_TIMEOUT)
+        try:
+            s.settimeout(max(0.1, Settings.NODE_PROBE_TIMEOUT
+                             - (perf_counter() - start)))
+            banner = s.recv(Settings.SOC_RECV_SIZE)
+        finally:
+            s.close()
+        float(banner.decode(Settings.ENCODING).strip())
+        return perf_counter() - start
+    except Exception as e:
+        debug_output(f"Probe of {node[0]}:{node[1]} failed: {e}")
+        return None
+
+
+node_resolver = NodeResolver()
+
+
+class LineReader:
+    """
+    Buffered, newline framed reader of a pool connection.
+    Partial reads are accumulated until the whole line is
+    there, so a job or feedback split over several TCP
+    segments is never parsed as garbage. The reads are
+    generators, their recv steps are run by the I/O layer
+    of the engine (ThreadIO or AsyncIO) that owns s
+    """
+    def __init__(self, s, max_line: int = None):
+        self.s = s
+        self.buffer = b""
+        self.max_line = max_line or Settings.SOC_MAX_LINE
+
+    def fill(self, deadline):
+        """
+        Receive once before the deadline. Returns False
+        when the deadline passed without data
+        """
+        remaining = deadline - time()
+        if remaining <= 0:
+            return False
+        chunk = yield ("recv", self, remaining)
+        if chunk is None:
+            return False
+        if not chunk:
+            raise Exception("Connection closed by the node")
+        self.buffer += chunk
+        if len(self.buffer) > self.max_line:
+            self.buffer = b""
+            raise Exception("Line exceeds "
+                            + str(self.max_line) + " bytes")
+        return True
+
+    def readline(self, timeout: float = None, settle: float = None):
+        """
+        Next line without the newline. All reads share one
+        deadline. With settle, data that stays without newline
+        for that long is returned as the line (version banner)
+        """
+        deadline = time() + (timeout or Settings.SOC_TIMEOUT)
+        while b"\n" not in self.buffer:
+            if settle and self.buffer:
+                if not (yield from self.fill(
+                        min(deadline, time() + settle))):
+                    break
+            elif not (yield from self.fill(deadline)):
+                raise Exception("Timed out waiting for the node")
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line.decode(Settings.ENCODING).rstrip("\r")
+
+    def read_idle(self, timeout: float = None, settle: float = None):
+        """
+        Everything the node sends until it goes quiet,
+        for multi-line messages like the MOTD
+        """
+        deadline = time() + (timeout or Settings.SOC_TIMEOUT)
+        settle = settle or Settings.SOC_SETTLE
+        while not self.buffer:
+            if not (yield from self.fill(deadline)):
+                raise Exception("Timed out waiting for the node")
+        while (yield from self.fill(min(deadline, time() + settle))):
+            pass
+        data, self.buffer = self.buffer, b""
+        return data.decode(Settings.ENCODING).rstrip("\n")
 
 
 class Donate:
@@ -327,11 +731,8 @@ class Donate:
                          'error')
 
 
-shares = [0, 0, 0]
-bad_crc8 = 0
-i2c_retry_count = 0
-hashrate_mean = []
-ping_mean = []
+slave_stats = []
+ramp = None
 diff = 0
 shuffle_ports = "y"
 donator_running = False
@@ -340,7 +741,6 @@ debug = 'n'
 discord_presence = 'y'
 rig_identifier = 'None'
 donation_level = 0
-hashrate = 0
 config = ConfigParser()
 mining_start_time = time()
 
@@ -495,11 +895,34 @@ def handler(signal_received, frame):
 signal(SIGINT, handler)
 
 
+def parse_adaptors(usbi2c_port, usbi2c_baudrate, avrport):
+    """
+    Split the adaptor settings into (port, baudrate, I2CS list)
+    per adaptor. usbi2c_port and usbi2c_baudrate are comma
+    separated, a single baudrate applies to every adaptor.
+    I2CS lists of different adaptors in avrport are separated
+    by semicolons, e.g. 8,9,a;8,9
+    """
+    ports = [port.strip() for port in str(usbi2c_port).split(',')
+             if port.strip()]
+    baudrates = [int(baudrate) for baudrate
+                 in str(usbi2c_baudrate).replace(" ", "").split(',')
+                 if baudrate]
+    slaves = [group.split(',') for group
+              in str(avrport).replace(" ", "").split(';')]
+
+    if len(baudrates) == 1:
+        baudrates = baudrates * len(ports)
+    if len(baudrates) != len(ports) or len(slaves) != len(ports):
+        raise Exception("usbi2c_port, usbi2c_baudrate and avrport "
+                        + "list a different number of adaptors")
+    return list(zip(ports, baudrates, slaves))
+
+
 def load_config():
     global username
     global donation_level
     global avrport
-    global hashrate_list
     global debug
     global rig_identifier
     global discord_presence
@@ -508,6 +931,7 @@ def load_config():
     global ser
     global usbi2c_port
     global usbi2c_baudrate
+    global adaptors
 
     if not Path(str(Settings.DATA_DIR) + '/Settings.cfg').is_file():
         print(
@@ -688,26 +1112,40 @@ def load_config():
             "avr_timeout":      10,
             "delay_start":      Settings.DELAY_START,
             "crc8_en":          Settings.CRC8_EN,
+            "verify_results":   Settings.VERIFY_RESULTS,
             "discord_presence": "y",
             "periodic_report":  60,
             "shuffle_ports":    "y",
             "mining_key":       mining_key,
             "usbi2c_port":      usbi2c_port,
-            "usbi2c_baudrate":  usbi2c_baudrate}
+            "usbi2c_baudrate":  usbi2c_baudrate,
+            "engine":           Settings.ENGINE,
+            "job_prefetch":     Settings.JOB_PREFETCH,
+            "prefetch_max_age": Settings.PREFETCH_MAX_AGE,
+            "metrics_port":     Settings.METRICS_PORT,
+            "pool_picker":      Settings.POOL_PICKER,
+            "pool_nodes":       Settings.POOL_NODES,
+            "node_probe_interval": Settings.NODE_PROBE_INTERVAL,
+            "usbi2c_binary":    Settings.USBI2C_BINARY,
+            "usbi2c_calibrate": Settings.BAUD_CALIBRATE,
+            "i2c_clock":        Settings.I2C_CLOCK,
+            "topology_interval": Settings.TOPOLOGY_INTERVAL}
 
         with open(str(Settings.DATA_DIR)
                   + '/Settings.cfg', 'w') as configfile:
             config.write(configfile)
 
+        adaptors = parse_adaptors(usbi2c_port, usbi2c_baudrate, avrport)
         avrport = avrport.split(',')
         print(Style.RESET_ALL + get_string('config_saved'))
-        hashrate_list = [0] * len(avrport)
 
     else:
         config.read(str(Settings.DATA_DIR) + '/Settings.cfg')
         username = config["AVR Miner"]['username']
-        avrport = config["AVR Miner"]['avrport']
-        avrport = avrport.replace(" ", "").split(',')
+        adaptors = parse_adaptors(config["AVR Miner"]['usbi2c_port'],
+                                  config["AVR Miner"]['usbi2c_baudrate'],
+                                  config["AVR Miner"]['avrport'])
+        avrport = [com for _, _, slaves in adaptors for com in slaves]
         donation_level = int(config["AVR Miner"]['donate'])
         debug = config["AVR Miner"]['debug']
         rig_identifier = config["AVR Miner"]['identifier']
@@ -715,12 +1153,34 @@ def load_config():
         Settings.AVR_TIMEOUT = float(config["AVR Miner"]["avr_timeout"])
         Settings.DELAY_START = int(config["AVR Miner"]["delay_start"])
         Settings.CRC8_EN = config["AVR Miner"]["crc8_en"]
+        Settings.VERIFY_RESULTS = config["AVR Miner"].get(
+            "verify_results", Settings.VERIFY_RESULTS)
         discord_presence = config["AVR Miner"]["discord_presence"]
         shuffle_ports = config["AVR Miner"]["shuffle_ports"]
         Settings.REPORT_TIME = int(config["AVR Miner"]["periodic_report"])
-        hashrate_list = [0] * len(avrport)
-        usbi2c_port = config["AVR Miner"]['usbi2c_port']
-        Settings.BAUDRATE = int(config["AVR Miner"]['usbi2c_baudrate'])
+        usbi2c_port = adaptors[0][0]
+        Settings.BAUDRATE = adaptors[0][1]
+        Settings.ENGINE = config["AVR Miner"].get("engine", Settings.ENGINE)
+        Settings.JOB_PREFETCH = config["AVR Miner"].get(
+            "job_prefetch", Settings.JOB_PREFETCH)
+        Settings.PREFETCH_MAX_AGE = float(config["AVR Miner"].get(
+            "prefetch_max_age", Settings.PREFETCH_MAX_AGE))
+        Settings.METRICS_PORT = int(config["AVR Miner"].get(
+            "metrics_port", Settings.METRICS_PORT))
+        Settings.POOL_PICKER = config["AVR Miner"].get(
+            "pool_picker", Settings.POOL_PICKER)
+        Settings.POOL_NODES = config["AVR Miner"].get(
+            "pool_nodes", Settings.POOL_NODES)
+        Settings.NODE_PROBE_INTERVAL = float(config["AVR Miner"].get(
+            "node_probe_interval", Settings.NODE_PROBE_INTERVAL))
+        Settings.USBI2C_BINARY = config["AVR Miner"].get(
+            "usbi2c_binary", Settings.USBI2C_BINARY)
+        Settings.BAUD_CALIBRATE = config["AVR Miner"].get(
+            "usbi2c_calibrate", Settings.BAUD_CALIBRATE)
+        Settings.I2C_CLOCK = int(config["AVR Miner"].get(
+            "i2c_clock", Settings.I2C_CLOCK))
+        Settings.TOPOLOGY_INTERVAL = float(config["AVR Miner"].get(
+            "topology_interval", Settings.TOPOLOGY_INTERVAL))
 
 
 def greeting():
@@ -766,7 +1226,9 @@ def greeting():
         + Settings.BLOCK + Style.NORMAL
         + Fore.RESET + get_string('avr_on_port')
         + Style.BRIGHT + Fore.YELLOW
-        + ', '.join(avrport))
+        + ('; '.join(port + ' (' + ', '.join(slaves) + ')'
+                     for port, _, slaves in adaptors)
+           if len(adaptors) > 1 else ', '.join(avrport)))
 
     if osname == 'nt' or osname == 'posix':
         print(
@@ -813,11 +1275,12 @@ def update_rich_presence():
     startTime = int(time())
     while True:
         try:
-            total_hashrate = get_prefix("H/s", sum(hashrate_list), 2)
+            totals = stats_totals()
+            total_hashrate = get_prefix("H/s", totals["hashrate"], 2)
             RPC.update(details="Hashrate: " + str(total_hashrate),
                        start=mining_start_time,
-                       state=str(shares[0]) + "/"
-                       + str(shares[0] + shares[1])
+                       state=str(totals["accepted"]) + "/"
+                       + str(totals["accepted"] + totals["rejected"])
                        + " accepted shares",
                        large_image="avrminer",
                        large_text="Duino-Coin, "
@@ -908,37 +1371,559 @@ def share_print(id, type, accept, reject, total_hashrate,
               + f"ping {(int(ping))}ms")
         printlock.release()
 
-def usbi2c_write(ser,com,data):
-    serlock.acquire()
-    ser.write(bytes(str(str(com)
-                        + Settings.USBI2C_SEPARATOR
-                        + "w"
-                        + Settings.USBI2C_SEPARATOR
-                        + str(data)
-                        + Settings.USBI2C_EOL),
-                        encoding=Settings.ENCODING))
-    serlock.release()
-        
-def usbi2c_read(ser,com):
-    serlock.acquire()
-    ser.write(bytes(str(str(com)
-                        + Settings.USBI2C_SEPARATOR
-                        + "r"
-                        + Settings.USBI2C_EOL),
-                        encoding=Settings.ENCODING))
-    data = ser.read_until(b'$').decode().strip(Settings.USBI2C_EOL).split(Settings.USBI2C_SEPARATOR)
-    serlock.release()
-        
-    return data
-        
-def flush_i2c(ser,com,period=2):
-    # period is not useful here. ignore
-    with thread_lock():
-        usbi2c_write(ser,"fl",com)
-        sleep(0.1)
+def usbi2c_cmd(*fields):
+    return bytes(Settings.USBI2C_SEPARATOR.join(str(f) for f in fields)
+                 + Settings.USBI2C_EOL,
+                 encoding=Settings.ENCODING)
 
-def crc8(data):
-    crc = 0
+def usbi2c_parse(reply):
+    return reply.decode().strip(Settings.USBI2C_EOL).split(Settings.USBI2C_SEPARATOR)
+
+def usbi2c_frame(op, com, payload=b""):
+    """
+    Binary frame: SOF, version<<4|op, address, length,
+    payload and CRC8 over everything after SOF
+    """
+    if isinstance(payload, str):
+        payload = payload.encode(Settings.ENCODING)
+    header = bytes((Settings.USBI2C_BIN_VERSION << 4 | op, com, len(payload)))
+    return (bytes((Settings.USBI2C_SOF,)) + header + payload
+            + bytes((crc8_update(crc8(header), payload),)))
+
+def usbi2c_write_cmd(com, data, bulk=False, binary=False):
+    """
+    Bytes writing data to the I2CS: binary frames, bulk writes
+    (firmware v0.4+) or one write command per character
+    """
+    chunks = range(0, len(data), Settings.USBI2C_BULK_MAX)
+    if binary:
+        return b"".join(usbi2c_frame(
+            Settings.USBI2C_OP_WRITE, com,
+            data[i:i+Settings.USBI2C_BULK_MAX]) for i in chunks)
+    if bulk:
+        return b"".join(usbi2c_cmd(
+            com, "b", data[i:i+Settings.USBI2C_BULK_MAX]) for i in chunks)
+    return b"".join(usbi2c_cmd(com, "w", c) for c in data)
+
+def usbi2c_read_cmd(addrs, burst=False, binary=False):
+    """
+    Bytes reading the response buffers of the I2CS in addrs in one
+    batch. A burst read returns up to the newline in one round trip
+    (firmware v0.4+), a binary batch is a single frame
+    """
+    if binary:
+        return usbi2c_frame(Settings.USBI2C_OP_READ, addrs[0],
+                            bytes([Settings.USBI2C_BURST_MAX]
+                                  + list(addrs[1:])))
+    if burst:
+        return b"".join(usbi2c_cmd(addr, "rn", Settings.USBI2C_BURST_MAX)
+                        for addr in addrs)
+    return b"".join(usbi2c_cmd(addr, "r") for addr in addrs)
+
+def usbi2c_flush_cmd(com, binary=False):
+    if binary:
+        return usbi2c_frame(Settings.USBI2C_OP_FLUSH, com)
+    return usbi2c_cmd("fl", "w", com)
+
+def usbi2c_scan_cmd():
+    # no binary scan, the reply is a text line in both modes
+    return usbi2c_cmd("scn")
+
+def usbi2c_parse_frame(header, body):
+    """
+    Binary reply frame into the [address, data] form of
+    usbi2c_parse. body is payload plus CRC8
+    """
+    if (header[0] != Settings.USBI2C_SOF
+            or header[1] >> 4 != Settings.USBI2C_BIN_VERSION):
+        raise Exception("USBI2C frame corrupted")
+    if crc8_update(crc8(header[1:]), body[:-1]) != body[-1]:
+        raise Exception("USBI2C frame crc8 failed")
+    return ["%02x" % header[2], body[:-1].decode()]
+
+def usbi2c_probe(ser, boot_time=0):
+    """
+    Query adaptor firmware version and capabilities.
+    Firmware older than v0.3 does not answer, in which
+    case the legacy command set is assumed. ver$ is
+    repeated for boot_time seconds for an adaptor that
+    is still in its bootloader
+    """
+    deadline = time() + boot_time
+    timeout = ser.timeout
+    try:
+        ser.timeout = Settings.USBI2C_PROBE_TIMEOUT
+        while True:
+            # drop bootloader output and replies to earlier probes
+            ser.reset_input_buffer()
+            ser.write(bytes(str("ver" + Settings.USBI2C_EOL),
+                            encoding=Settings.ENCODING))
+            reply = ser.read_until(b'\n').decode(errors="ignore").strip()
+            if Settings.USBI2C_SEPARATOR in reply or time() >= deadline:
+                break
+    finally:
+        ser.timeout = timeout
+
+    if Settings.USBI2C_SEPARATOR not in reply:
+        return "0.2", set()
+    version, _, caps = reply.partition(Settings.USBI2C_SEPARATOR)
+    return version, set(caps.split(","))
+
+
+def usbi2c_i2c_clock(ser, clock):
+    """
+    Set the I2C clock of the adaptor. Returns the clock the
+    adaptor runs at, None if it did not answer
+    """
+    timeout = ser.timeout
+    try:
+        ser.reset_input_buffer()
+        ser.timeout = Settings.USBI2C_PROBE_TIMEOUT
+        ser.write(usbi2c_cmd("clk", clock))
+        reply = ser.read_until(b'\n').decode(errors="ignore").strip()
+    finally:
+        ser.timeout = timeout
+
+    cmd, _, value = reply.partition(Settings.USBI2C_SEPARATOR)
+    if cmd != "clk" or not value.isdigit():
+        return None
+    return int(value)
+
+
+def usbi2c_echo(ser, rounds=None):
+    """
+    Link test: random payloads sent through the echo command
+    of the adaptor must all come back unchanged
+    """
+    if rounds is None:
+        rounds = Settings.BAUD_ECHO_ROUNDS
+    # printable, without the separator and end of line of the commands
+    chars = [chr(c) for c in range(0x21, 0x7f) if chr(c) not in ":$"]
+    for _ in range(rounds):
+        payload = "".join(choices(chars, k=Settings.USBI2C_BULK_MAX))
+        ser.write(usbi2c_cmd("ec", payload))
+        if ser.read_until(b'\n') != payload.encode() + b'\n':
+            return False
+    return True
+
+
+def usbi2c_resync(ser, baudrate):
+    """
+    Probe the adaptor at baudrate after bytes went out at another
+    rate. The lone EOL ends whatever garbage the adaptor has buffered
+    """
+    ser.baudrate = baudrate
+    sleep(0.1)
+    ser.reset_input_buffer()
+    ser.write(bytes(Settings.USBI2C_EOL, encoding=Settings.ENCODING))
+    return usbi2c_probe(ser)
+
+
+def usbi2c_switch(ser, baudrate):
+    """
+    Move the adaptor and the port to baudrate and keep it only if
+    the echo test passes. On failure the adaptor reverts by itself
+    after BAUD_CONFIRM_TIMEOUT and the port follows it back
+    """
+    previous = ser.baudrate
+    ser.reset_input_buffer()
+    ser.write(usbi2c_cmd("bd", baudrate))
+    if ser.read_until(b'\n').strip() != usbi2c_cmd("bd", baudrate)[:-1]:
+        # the adaptor may still have switched, wait it out
+        sleep(Settings.BAUD_CONFIRM_TIMEOUT)
+        usbi2c_resync(ser, previous)
+        return False
+
+    ser.baudrate = baudrate
+    sleep(0.05)
+    ser.reset_input_buffer()
+    if usbi2c_echo(ser):
+        ser.write(usbi2c_cmd("bd", "ok"))
+        if ser.read_until(b'\n') == b'ok\n':
+            return True
+
+    sleep(Settings.BAUD_CONFIRM_TIMEOUT)
+    if usbi2c_resync(ser, previous)[0] == "0.2":
+        # the confirmation got through but its reply did not
+        usbi2c_resync(ser, baudrate)
+    return False
+
+
+def usbi2c_serial_number(port):
+    """
+    USB serial number of the adaptor on port, the port itself
+    when there is none (e.g. a pseudo-terminal)
+    """
+    real = path.realpath(port)
+    try:
+        for info in serial.tools.list_ports.comports():
+            if info.device in (port, real) and info.serial_number:
+                return info.serial_number
+    except Exception:
+        pass
+    return port
+
+
+def load_calibration():
+    try:
+        with open(path.join(Settings.DATA_DIR, Settings.BAUD_CACHE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def usbi2c_calibrate(ser, port, version, start):
+    """
+    Find the fastest baudrate of the ladder that passes the echo
+    test and cache it by the adaptor USB serial number. A cached
+    rate is tried first, the ladder only runs when it fails.
+    start is the configured rate the adaptor firmware boots with
+    """
+    cache = load_calibration()
+    key = usbi2c_serial_number(port)
+    cached = cache.get(key, {})
+    timeout = ser.timeout
+    ser.timeout = Settings.USBI2C_PROBE_TIMEOUT
+    try:
+        if (cached.get("firmware") == version
+                and cached.get("start") == start):
+            if (cached["baudrate"] == ser.baudrate
+                    or usbi2c_switch(ser, cached["baudrate"])):
+                return ser.baudrate
+            debug_output(f"{port}: cached baudrate "
+                         + f"{cached['baudrate']} failed")
+
+        for baudrate in Settings.BAUD_LADDER:
+            if baudrate <= ser.baudrate:
+                continue
+            if usbi2c_switch(ser, baudrate):
+                debug_output(f"{port}: baudrate {baudrate} passed")
+            else:
+                debug_output(f"{port}: baudrate {baudrate} failed")
+    finally:
+        ser.timeout = timeout
+
+    cache[key] = {"baudrate": ser.baudrate, "firmware": version,
+                  "start": start}
+    try:
+        with open(path.join(Settings.DATA_DIR, Settings.BAUD_CACHE),
+                  "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        debug_output(f"{port}: calibration not cached: {e}")
+    return ser.baudrate
+
+
+class Transaction:
+    """
+    One unit of work for the USBI2C bus scheduler
+    """
+    __slots__ = ("kind", "addr", "data", "priority", "due", "future",
+                 "loop", "finished")
+
+    def __init__(self, kind, addr, data=None, priority=None, due=0,
+                 loop=None):
+        self.kind = kind
+        self.addr = addr
+        self.data = data
+        if priority is None:
+            if kind == "read":
+                priority = Settings.BUS_PRIO_DRAIN
+            elif kind == "scan":
+                priority = Settings.BUS_PRIO_SCAN
+            else:
+                priority = Settings.BUS_PRIO_LOAD
+        self.priority = priority
+        self.due = due
+        # asyncio callers get a future of their event loop, the bus
+        # thread completes it with one call_soon_threadsafe
+        self.loop = loop
+        self.future = loop.create_future() if loop else Future()
+        self.finished = False
+
+    def finish(self, value=None, error=None):
+        # called by the bus thread
+        self.finished = True
+        if self.loop is None:
+            self.complete(value, error)
+        else:
+            self.loop.call_soon_threadsafe(self.complete, value, error)
+
+    def complete(self, value, error):
+        if self.future.done():
+            # the asyncio caller was cancelled
+            return
+        if error is None:
+            self.future.set_result(value)
+        else:
+            self.future.set_exception(error)
+
+
+class USBI2CBus:
+    """
+    Single owner of the USBI2C adaptor serial port.
+    Workers submit transactions (write, read, flush, scan)
+    and wait on the returned Future. The scheduler thread
+    serves the I2CS round-robin so no slave can starve the
+    others, and batches reads of different I2CS into one
+    serial write.
+
+    Transactions are served by phase: job loads first, then
+    drains of I2CS already returning a result, then polls of
+    I2CS that may be done, bus scans only when nothing else is
+    ready. A poll can be deferred to a due
+    time, so the bus keeps loading and draining other I2CS
+    while one is still hashing
+    """
+    def __init__(self, ser, version="0.2", caps=None,
+                 port="", slaves=None, index=0, i2c_clock=100000):
+        self.ser = ser
+        self.version = version
+        self.caps = caps if caps is not None else set()
+        self.binary = "bin" in self.caps and Settings.USBI2C_BINARY == "y"
+        self.i2c_clock = i2c_clock
+        self.byte_time = Settings.USBI2C_BYTE_TIME * 100000 / i2c_clock
+        self.port = port
+        self.slaves = slaves if slaves is not None else []
+        self.index = index
+        # I2CS addresses of the last background bus scan
+        self.found = set()
+        self.scanned_at = 0
+        # I2CS response buffers, by hex address without 0x
+        self.responses = {}
+        self.queues = {}
+        # addresses whose head transaction can run, one deque per priority
+        self.ready = [deque() for _ in range(Settings.BUS_PRIO_SCAN + 1)]
+        # (due, seq, address) of heads deferred to a later time
+        self.waiting = []
+        self.seq = 0
+        self.cond = Condition()
+        self.adaptor_free_at = 0
+        # bus utilization counters
+        self.busy_time = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.transactions = 0
+        self.started_at = time()
+        self.last_sample = (self.started_at, 0)
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    def submit(self, kind, addr=0, data=None, priority=None, due=0,
+               loop=None):
+        tx = Transaction(kind, addr, data, priority, due, loop)
+        with self.cond:
+            queue = self.queues.setdefault(addr, deque())
+            queue.append(tx)
+            if len(queue) == 1:
+                self.schedule(addr)
+            self.cond.notify()
+        return tx.future
+
+    def utilization(self):
+        """
+        Fraction of wall time the serial port was busy
+        since the previous call
+        """
+        now_t = time()
+        last_t, last_busy = self.last_sample
+        self.last_sample = (now_t, self.busy_time)
+        if now_t <= last_t:
+            return 0
+        return min(1, (self.busy_time - last_busy) / (now_t - last_t))
+
+    def schedule(self, addr):
+        # caller holds self.cond, queue of addr is not empty
+        head = self.queues[addr][0]
+        if head.due > time():
+            self.seq += 1
+            heappush(self.waiting, (head.due, self.seq, addr))
+        else:
+            self.ready[head.priority].append(addr)
+
+    def promote(self):
+        # caller holds self.cond. Returns seconds until the next deferred head
+        now_t = time()
+        while self.waiting and self.waiting[0][0] <= now_t:
+            addr = heappop(self.waiting)[2]
+            self.ready[self.queues[addr][0].priority].append(addr)
+        if self.waiting:
+            return self.waiting[0][0] - now_t
+        return None
+
+    def peek(self):
+        # caller holds self.cond
+        for ready in self.ready:
+            if ready:
+                return ready
+        return None
+
+    def next_transaction(self, ready):
+        # caller holds self.cond
+        addr = ready.popleft()
+        queue = self.queues[addr]
+        tx = queue.popleft()
+        if queue:
+            self.schedule(addr)
+        return tx
+
+    def next_batch(self):
+        with self.cond:
+            while True:
+                timeout = self.promote()
+                ready = self.peek()
+                if ready:
+                    break
+                self.cond.wait(timeout)
+            batch = [self.next_transaction(ready)]
+            if batch[0].kind != "read":
+                return batch
+            size = self.read_size(batch[0].addr, True)
+            while True:
+                ready = self.peek()
+                if not ready:
+                    break
+                head = self.queues[ready[0]][0]
+                if head.kind != "read":
+                    break
+                size += self.read_size(head.addr, False)
+                if size > Settings.USBI2C_BATCH_MAX:
+                    break
+                batch.append(self.next_transaction(ready))
+            return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            start = time()
+            try:
+                if batch[0].kind == "read":
+                    self.execute_reads(batch)
+                else:
+                    self.execute(batch[0])
+            except Exception as e:
+                for tx in batch:
+                    if not tx.finished:
+                        tx.finish(error=e)
+                try:
+                    self.drain()
+                except Exception:
+                    pass
+            self.busy_time += time() - start
+            self.transactions += len(batch)
+
+    def drain(self):
+        """
+        Drop late replies of a failed batch so the next read is not
+        misaligned. reset_input_buffer() alone misses the replies
+        that arrive after it, they would be taken as the answer to
+        the next transaction
+        """
+        timeout = self.ser.timeout
+        self.ser.timeout = Settings.USBI2C_PROBE_TIMEOUT
+        try:
+            deadline = time() + Settings.USBI2C_DRAIN_MAX
+            while time() < deadline:
+                late = self.ser.read(max(1, self.ser.in_waiting))
+                if not late:
+                    break
+                self.bytes_in += len(late)
+                debug_output(f'{self.port}: dropped {len(late)} late bytes')
+        finally:
+            self.ser.timeout = timeout
+            self.ser.reset_input_buffer()
+
+    def read_cmd(self, addrs):
+        return usbi2c_read_cmd(addrs, "br" in self.caps, self.binary)
+
+    def read_size(self, addr, first):
+        # bytes a read adds to a batch, a binary batch is one frame
+        # with one more address byte per I2CS
+        if self.binary and not first:
+            return 1
+        return len(self.read_cmd([addr]))
+
+    def read_frame(self):
+        header = self.ser.read(4)
+        body = self.ser.read(header[3] + 1) if len(header) == 4 else b""
+        self.bytes_in += len(header) + len(body)
+        if len(header) < 4 or len(body) < header[3] + 1:
+            raise Exception("USBI2C read timed out")
+        return usbi2c_parse_frame(header, body)
+
+    def write(self, data):
+        self.ser.write(data)
+        self.bytes_out += len(data)
+
+    def wait_adaptor(self):
+        # adaptor has no write acknowledge, give it time to drain the
+        # previous I2C write before its serial RX buffer gets refilled
+        delay = self.adaptor_free_at - time()
+        if delay > 0:
+            sleep(delay)
+
+    def execute_reads(self, batch):
+        self.write(self.read_cmd([tx.addr for tx in batch]))
+        if self.binary:
+            for tx in batch:
+                tx.finish(self.read_frame())
+            self.adaptor_free_at = 0
+            return
+        for tx in batch:
+            reply = self.ser.read_until(b'$')
+            self.bytes_in += len(reply)
+            if not reply.endswith(b'$'):
+                raise Exception("USBI2C read timed out")
+            tx.finish(usbi2c_parse(reply))
+        self.adaptor_free_at = 0
+
+    def execute(self, tx):
+        self.wait_adaptor()
+        if tx.kind == "write":
+            self.write(usbi2c_write_cmd(tx.addr, tx.data,
+                                        "bw" in self.caps, self.binary))
+            self.adaptor_free_at = time() + len(tx.data) * self.byte_time
+            tx.finish(None)
+        elif tx.kind == "flush":
+            self.write(usbi2c_flush_cmd(tx.addr, self.binary))
+            self.adaptor_free_at = time() + Settings.USBI2C_FLUSH_TIME
+            tx.finish(None)
+        elif tx.kind == "scan":
+            self.write(usbi2c_scan_cmd())
+            reply = self.ser.read_until(b'\n')
+            self.bytes_in += len(reply)
+            tx.finish(reply.decode())
+        else:
+            raise Exception(f"Unknown USBI2C transaction {tx.kind}")
+
+
+def usbi2c_send(bus,com,data):
+    """
+    Steps sending a whole string to the I2CS. Uses the bulk
+    write command when the adaptor supports it, else falls
+    back to one write command per character
+    """
+    if "bw" in bus.caps or bus.binary:
+        yield ("bus", bus, "write", com, data)
+        return
+
+    for i in range(0, len(data)):
+        try:
+            yield ("bus", bus, "write", com, data[i])
+            yield ("sleep", 0.02)
+        except Exception as e:
+            debug_output(str(com) + f': {e}')
+
+def flush_i2c(bus,com):
+    yield ("bus", bus, "flush", int(com, base=16))
+
+def crc8_bitwise(data, crc=0):
+    """
+    Reference bit-by-bit CRC8 as computed by the I2CS firmware,
+    used to build CRC8_TABLE
+    """
     for i in range(len(data)):
         byte = data[i]
         for b in range(8):
@@ -951,314 +1936,1362 @@ def crc8(data):
             byte = byte >> 1
     return crc
 
-result_pool = {}
-def mine_avr(com, threadid, fastest_pool):
-    global hashrate
-    global bad_crc8
-    global i2c_retry_count
-    start_time = time()
-    report_shares = 0
-    last_report_share = 0
-    last_bad_crc8 = 0
-    last_i2c_retry_count = 0
-    _com = hex(int(com,base=16)).replace("0x","")
-    result_pool[_com] = ""
+CRC8_TABLE = tuple(crc8_bitwise((i,)) for i in range(256))
+
+def crc8_update(crc, data):
+    """
+    Feed more bytes into a running CRC8, e.g. as the
+    response arrives from the bus. Accepts bytes,
+    bytearray, memoryview or str
+    """
+    if isinstance(data, str):
+        data = data.encode(Settings.ENCODING)
+    table = CRC8_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+def crc8(data):
+    return crc8_update(0, data)
+
+def crc8_many(frames):
+    """
+    CRC8 of every frame in a batch, e.g. for verifying
+    the results of many I2CS at once
+    """
+    table = CRC8_TABLE
+    crcs = []
+    for data in frames:
+        if isinstance(data, str):
+            data = data.encode(Settings.ENCODING)
+        crc = 0
+        for byte in data:
+            crc = table[crc ^ byte]
+        crcs.append(crc)
+    return crcs
+
+
+def worker_name(bus, com):
+    """
+    Label of an I2CS in the output and towards the pool.
+    I2CS on other than the first adaptor get the adaptor
+    index in front so equal addresses stay distinct
+    """
+    if bus.index == 0:
+        return port_num(com)
+    return f"{bus.index}-{port_num(com)}"
+
+
+def job_request():
+    """
+    JOB request line sent to the pool
+    """
+    if config["AVR Miner"]["mining_key"] != "None":
+        key = b64.b64decode(config["AVR Miner"]["mining_key"]).decode("utf-8")
+    else:
+        key = config["AVR Miner"]["mining_key"]
+
+    return ('JOB'
+            + Settings.SEPARATOR
+            + str(username)
+            + Settings.SEPARATOR
+            + 'AVR'
+            + Settings.SEPARATOR
+            + str(key))
+
+
+def job_frame(com, job):
+    """
+    Pool job framed for the I2CS, with CRC8 when enabled
+    """
+    i2c_data = str(job[0]
+                    + Settings.SEPARATOR
+                    + job[1]
+                    + Settings.SEPARATOR
+                    + job[2]
+                    + Settings.SEPARATOR)
+
+    if Settings.CRC8_EN == "y":
+        i2c_data = str(i2c_data + str(crc8(i2c_data.encode())) + '\n')
+        debug_output(com + f': Job+crc8: {i2c_data}')
+    else:
+        i2c_data = str(i2c_data + '\n')
+        debug_output(com + f': Job: {i2c_data}')
+    return i2c_data
+
+
+def i2c_collect(bus, i2c_rdata):
+    """
+    Put an adaptor read reply into the response buffer of the
+    I2CS it came from. Returns the I2CS address and "data",
+    "corrupted" (I2CS error marker) or "idle"
+    """
+    i2cs_raddr = hex(int(i2c_rdata[0],base=16)).replace("0x","")
+
+    if ((i2c_rdata[1].isalnum()) or (',' in i2c_rdata[1])):
+        bus.responses[i2cs_raddr] += i2c_rdata[1].strip()
+        return i2cs_raddr, "data"
+    elif ('#' in i2c_rdata[1]):
+        return i2cs_raddr, "corrupted"
+    return i2cs_raddr, "idle"
+
+
+def i2c_result(bus, com, i2cs_raddr, i2c_rdata):
+    """
+    Result fields once the I2CS response is complete, else None
+    """
+    result = bus.responses[i2cs_raddr].split(',')
+    if ((len(result)==4) and ('\n' in i2c_rdata[1]) and (Settings.CRC8_EN == "y")):
+        debug_output(com + " i2c_responses:" + f'{bus.responses[i2cs_raddr]}')
+        return result
+    elif ((len(result)==3) and ('\n' in i2c_rdata[1]) and (Settings.CRC8_EN == "n")):
+        debug_output(com + " i2c_responses:" + f'{bus.responses[i2cs_raddr]}')
+        return result
+    return None
+
+
+def check_result(bus, com, i2cs_raddr, result, stats):
+    if result[0] and result[1]:
+        _ = int(result[0])
+        if (not _ and Settings.CRC8_EN != "y"
+                and Settings.VERIFY_RESULTS != "y"):
+            # nonce 0 solves one job in diff*100, without CRC8 it is
+            # more likely garbage. With CRC8 the check below decides,
+            # with verification verify_result
+            debug_output(com + ' Invalid result')
+            raise Exception("Invalid result")
+        _ = int(result[1])
+        if not result[2].isalnum():
+            debug_output(com + ' Corrupted DUCOID')
+            raise Exception("Corrupted DUCOID")
+        if Settings.CRC8_EN == "y":
+            _resp = bus.responses[i2cs_raddr].rpartition(Settings.SEPARATOR)[0]+Settings.SEPARATOR
+            result_crc8 = crc8(_resp.encode())
+            if int(result[3]) != result_crc8:
+                stats.bad_crc8 += 1
+                debug_output(com + f': crc8:: expect:{result_crc8} measured:{result[3]}')
+                raise Exception("crc8 checksum failed")
+    else:
+        raise Exception("No data received from AVR")
+
+
+class ResultVerifier:
+    """
+    Host side DUCO-S1 check of the results of one I2CS. The SHA-1
+    state after the last block hash is prepared while the I2CS is
+    hashing, so checking a result only hashes the nonce digits
+    """
+    __slots__ = ("last", "base")
+
+    def __init__(self):
+        self.last = None
+        self.base = None
+
+    def prepare(self, job):
+        if job[0] != self.last:
+            self.base = hashlib.sha1(job[0].encode(Settings.ENCODING))
+            self.last = job[0]
+
+    def check(self, job, nonce):
+        self.prepare(job)
+        digest = self.base.copy()
+        digest.update(str(nonce).encode(Settings.ENCODING))
+        return digest.hexdigest() == job[1]
+
+
+def verify_result(verifier, com, job, result, stats):
+    if Settings.VERIFY_RESULTS != "y":
+        return
+    if not verifier.check(job, int(result[0])):
+        stats.bad_results += 1
+        debug_output(com + f': nonce {result[0]} does not solve the job')
+        raise Exception("Result failed DUCO-S1 verification")
+
+
+def result_hashrate(stats, result):
+    computetime = round(int(result[1]) / 1000000, 5)
+    num_res = int(result[0])
+    # nonces 0 to num_res were hashed, nonce 0 is one hash too
+    hashrate_t = round((num_res + 1) / computetime, 2)
+
+    stats.computetime = computetime
+    stats.add_hashrate(hashrate_t)
+    return computetime, num_res, hashrate_t
+
+
+def result_line(com, num_res, hashrate_t, result):
+    return (str(num_res)
+            + Settings.SEPARATOR
+            + str(hashrate_t)
+            + Settings.SEPARATOR
+            + f'USBI2C AVR Miner {Settings.VER}'
+            + Settings.SEPARATOR
+            + str(rig_identifier)
+            + str(port_num(com))
+            + Settings.SEPARATOR
+            + str(result[2]))
+
+
+def share_feedback(com, feedback, hashrate_t, computetime, diff, ping,
+                   stats):
+    """
+    Count and print the pool verdict on a share.
+    Returns False when the feedback was not understood
+    """
+    if feedback[0] == 'GOOD':
+        stats.accepted += 1
+    elif feedback[0] == 'BLOCK':
+        stats.accepted += 1
+        stats.blocks += 1
+    else:
+        stats.rejected += 1
+
+    totals = stats_totals()
+    accepted, rejected = totals["accepted"], totals["rejected"]
+    if feedback[0] == 'GOOD':
+        share_print(port_num(com), "accept",
+                    accepted, rejected, stats.hashrate,
+                    computetime, diff, ping)
+    elif feedback[0] == 'BLOCK':
+        share_print(port_num(com), "block",
+                    accepted, rejected, stats.hashrate,
+                    computetime, diff, ping)
+    elif feedback[0] == 'BAD':
+        reason = feedback[1] if len(feedback) > 1 else None
+        share_print(port_num(com), "reject",
+                    accepted, rejected, hashrate_t,
+                    computetime, diff, ping, reason)
+    else:
+        share_print(port_num(com), "reject",
+                    accepted, rejected, hashrate_t,
+                    computetime, diff, ping, feedback)
+
+    title(get_string('duco_avr_miner') + str(Settings.VER)
+          + f') - {accepted}/{(accepted + rejected)}'
+          + get_string('accepted_shares'))
+    return feedback[0] in ('GOOD', 'BLOCK', 'BAD')
+
+
+def server_version_print(server_version):
+    """
+    Returns True when the miner is outdated
+    """
+    if float(server_version) <= float(Settings.VER):
+        pretty_print(
+            'net0', get_string('connected')
+            + Style.NORMAL + Fore.RESET
+            + get_string('connected_server')
+            + str(server_version) + ")",
+            'success')
+        return False
+
+    pretty_print(
+        'sys0', f"{get_string('miner_is_outdated')} (v{Settings.VER}) -"
+        + get_string('server_is_on_version')
+        + server_version + Style.NORMAL
+        + Fore.RESET + get_string('update_warning'),
+        'warning')
+    return True
+
+
+def motd_print(threadid, motd):
+    if "\n" in motd:
+        motd = motd.replace("\n", "\n\t\t")
+
+    pretty_print("net" + str(threadid),
+                 get_string("motd") + Fore.RESET
+                 + Style.NORMAL + str(motd),
+                 "success")
+    return motd
+
+
+def prefetch_job(name, spare, pool):
+    """
+    Steps requesting the next job on the spare pool connection
+    while the I2CS is still hashing. Returns the spare connection
+    and (job, fetch time), or (None, None) when the prefetch failed
+    """
+    try:
+        if spare is None:
+            spare = yield ("connect", pool)
+            yield from spare.readline(settle=Settings.SOC_SETTLE)
+        yield ("send", spare, job_request())
+        job = (yield from spare.readline()).split(Settings.SEPARATOR)
+        int(job[2])
+        debug_output(name + f": Prefetched: {job[0]}")
+        return spare, (job, time())
+    except Exception as e:
+        debug_output(name + f": Job prefetch failed: {e}")
+        yield ("close", spare)
+        return None, None
+
+
+def prefetch_fresh(name, next_job):
+    if time() - next_job[1] <= Settings.PREFETCH_MAX_AGE:
+        return True
+    debug_output(name + f": Prefetched job aged out: {next_job[0][0]}")
+    return False
+
+
+class Ring:
+    """
+    Fixed size ring of the latest samples, add() returns their mean
+    """
+    __slots__ = ("samples", "pos", "count")
+
+    def __init__(self, size):
+        self.samples = [0] * size
+        self.pos = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.pos] = value
+        self.pos = (self.pos + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+        return sum(self.samples) / self.count
+
+
+class Histogram:
+    """
+    Latency histogram on the fixed Settings.LATENCY_BUCKETS bounds,
+    the last count holds everything above the largest bound
+    """
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(Settings.LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(Settings.LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total += other.total
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the quantile, capped
+        # at the largest bound
+        if not self.count:
+            return 0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= q * self.count:
+                break
+        return Settings.LATENCY_BUCKETS[min(i, len(Settings.LATENCY_BUCKETS) - 1)]
+
+    def to_dict(self):
+        return {"le": list(Settings.LATENCY_BUCKETS) + ["+Inf"],
+                "counts": list(self.counts),
+                "sum": round(self.total, 6),
+                "count": self.count,
+                "p50": self.quantile(0.5),
+                "p90": self.quantile(0.9)}
+
+
+class SlaveStats:
+    """
+    Share counters, rolling hashrate and ping of one I2CS.
+    Only the worker of the I2CS writes them, so the counters need
+    no lock and other threads read them as plain attributes.
+    Samples are kept in fixed size rings, memory stays constant
+    """
+    __slots__ = ("name", "accepted", "rejected", "blocks", "bad_crc8",
+                 "bad_results", "i2c_retries", "timeouts", "hashrate", "computetime",
+                 "ping", "hashrates", "pings", "phases", "health")
+
+    def __init__(self, name):
+        self.name = name
+        self.accepted = 0
+        self.rejected = 0
+        self.blocks = 0
+        self.bad_crc8 = 0
+        self.bad_results = 0
+        self.i2c_retries = 0
+        self.timeouts = 0
+        self.hashrate = 0
+        self.computetime = 0
+        self.ping = 0
+        self.hashrates = Ring(Settings.HASHRATE_WINDOW)
+        self.pings = Ring(Settings.PING_WINDOW)
+        self.phases = {phase: Histogram() for phase in Settings.PHASES}
+        self.health = SlaveHealth(name)
+
+    def add_hashrate(self, hashrate_t):
+        self.hashrate = self.hashrates.add(hashrate_t)
+
+    def add_ping(self, ping_t):
+        self.ping = self.pings.add(ping_t)
+
+    def phase(self, phase, seconds):
+        self.phases[phase].observe(seconds)
+
+
+class SlaveHealth:
+    """
+    Health of one I2CS scored from its SlaveStats counters after
+    every job attempt. A degraded I2CS waits an exponential backoff
+    between attempts so it holds the bus less, a failing one is
+    quarantined off the bus and let back on probation once a bus
+    scan finds it again. present is cleared by the topology manager
+    while the I2CS is unplugged
+    """
+    __slots__ = ("name", "score", "state", "faults", "level",
+                 "quarantines", "until", "last", "present")
+
+    STATES = ("healthy", "degraded", "quarantined", "absent")
+
+    def __init__(self, name):
+        self.name = name
+        self.score = 0
+        self.state = "healthy"
+        # consecutive faulty attempts
+        self.faults = 0
+        # quarantines since the last healthy state, sets their length
+        self.level = 0
+        self.quarantines = 0
+        self.until = 0
+        self.last = (0, 0, 0, 0)
+        self.present = Event()
+        self.present.set()
+
+    def update(self, stats):
+        counters = (stats.i2c_retries, stats.bad_crc8, stats.timeouts,
+                    stats.rejected)
+        if counters[:3] != self.last[:3]:
+            fault = 1
+        elif counters[3] != self.last[3]:
+            fault = Settings.HEALTH_REJECT_FAULT
+        else:
+            fault = 0
+        self.last = counters
+        self.score += (fault - self.score) * Settings.HEALTH_ALPHA
+        self.faults = self.faults + 1 if fault else 0
+
+        if self.state == "quarantined":
+            return
+        if self.score >= Settings.HEALTH_QUARANTINE:
+            self.quarantine()
+        elif (self.state == "healthy"
+                and self.score >= Settings.HEALTH_DEGRADED):
+            self.change("degraded", "warning")
+        elif (self.state == "degraded"
+                and self.score < Settings.HEALTH_RECOVERED):
+            self.level = 0
+            self.change("healthy", "success")
+
+    def backoff(self):
+        if self.state != "degraded" or not self.faults:
+            return 0
+        return min(Settings.HEALTH_BACKOFF_MAX,
+                   Settings.HEALTH_BACKOFF_MIN * 2 ** (self.faults - 1))
+
+    def quarantine(self):
+        period = min(Settings.QUARANTINE_MAX,
+                     Settings.QUARANTINE_TIME * 2 ** self.level)
+        self.level += 1
+        self.quarantines += 1
+        self.until = time() + period
+        self.change("quarantined", "error", f" for {period}s")
+
+    def probe(self, found):
+        """
+        Outcome of the bus scan at the end of the quarantine,
+        returns True when the I2CS may mine again
+        """
+        if not found:
+            self.quarantine()
+            return False
+        self.score = Settings.HEALTH_DEGRADED
+        self.faults = 0
+        self.change("degraded", "warning", ", back on probation")
+        return True
+
+    def off_bus(self):
+        return self.state == "quarantined" or not self.present.is_set()
+
+    def status(self):
+        return self.state if self.present.is_set() else "absent"
+
+    def gone(self):
+        pretty_print("sys" + self.name,
+                     " I2CS is gone from the bus, worker parked", "warning")
+        self.present.clear()
+
+    def returned(self):
+        """
+        I2CS found on the bus again, likely a replugged or replaced
+        board so it starts with a clean score
+        """
+        self.score = 0
+        self.faults = 0
+        self.level = 0
+        self.until = 0
+        self.state = "healthy"
+        pretty_print("sys" + self.name,
+                     " I2CS is back on the bus, worker resumed", "success")
+        self.present.set()
+
+    def change(self, state, level, detail=""):
+        self.state = state
+        pretty_print("sys" + self.name,
+                     f" I2CS {state}{detail} (health score "
+                     + f"{self.score:.2f})", level)
+
+
+def i2cs_present(scan, addr):
+    # scan reply lists the I2CS found as upper case hex, e.g. 08 09 0A
+    return "%02X" % addr in scan.split()
+
+
+def quarantine_wait(bus, addr, health, tick):
+    """
+    Steps keeping a quarantined I2CS off the bus until a bus scan
+    at the end of its quarantine finds it again. tick runs every
+    second
+    """
+    scan = None
+    while True:
+        while time() < health.until:
+            yield ("sleep", min(1, max(0, health.until - time())))
+            tick()
+            if not health.present.is_set():
+                return
+        if scan is None:
+            scan = bus.submit("scan")
+        try:
+            reply = yield ("wait", scan, Settings.SCAN_TIMEOUT)
+        except Exception as e:
+            debug_output(health.name + f': scan failed: {e}')
+            reply = ""
+        if reply is None:
+            # saturated bus, keep waiting for the queued scan
+            tick()
+            if not health.present.is_set():
+                return
+            continue
+        scan = None
+        if health.probe(i2cs_present(reply, addr)):
+            return
+
+
+def absent_wait(health, tick):
+    """
+    Steps parking the worker of an unplugged I2CS until the
+    topology manager finds it again. tick runs every second
+    """
+    while not health.present.is_set():
+        yield ("sleep", 1)
+        tick()
+
+
+def scan_addresses(scan):
+    # I2CS addresses listed by a scan reply
+    found = set()
+    for token in scan.split():
+        try:
+            if len(token) == 2:
+                found.add(int(token, 16))
+        except ValueError:
+            pass
+    return found
+
+
+class Topology:
+    """
+    Background hot-plug detection. Scans every adaptor each
+    TOPOLOGY_INTERVAL seconds at the lowest bus priority, so scans
+    only fill idle bus windows, and caches the result in bus.found.
+    Workers of configured I2CS that are gone are parked and resumed
+    when they are back, a new address gets a worker of its own.
+    Addresses found by the first scan that are not in avrport are
+    left alone, they may be other I2C devices on the bus
+    """
+    def __init__(self, fastest_pool, spawn):
+        self.fastest_pool = fastest_pool
+        # spawn(com, threadid, fastest_pool, bus) starts a worker
+        self.spawn = spawn
+        self.foreign = {}
+        self.misses = {}
+        # scan of each bus still queued from an earlier round
+        self.pending = {}
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        while True:
+            for bus in buses:
+                try:
+                    self.scan(bus)
+                except Exception as e:
+                    debug_output(f'{bus.port}: topology scan failed: {e}')
+            sleep(Settings.TOPOLOGY_INTERVAL)
+
+    def scan(self, bus):
+        scan = self.pending.pop(bus.index, None) or bus.submit("scan")
+        try:
+            reply = scan.result(Settings.SCAN_TIMEOUT)
+        except future_timeout:
+            # no answer is not a miss, the round is skipped
+            self.pending[bus.index] = scan
+            debug_output(f'{bus.port}: bus busy, topology scan still queued')
+            return
+        found = scan_addresses(reply)
+        bus.found = found
+        bus.scanned_at = time()
+        known = {int(com, base=16): threadid
+                 for threadid, (worker_bus, com) in enumerate(workers)
+                 if worker_bus is bus}
+        if bus.index not in self.foreign:
+            self.foreign[bus.index] = found - set(known)
+            if self.foreign[bus.index]:
+                debug_output(f'{bus.port}: not mining on '
+                             + " ".join("%02X" % addr for addr
+                                        in sorted(self.foreign[bus.index])))
+
+        for addr, threadid in known.items():
+            health = slave_stats[threadid].health
+            key = (bus.index, addr)
+            if addr in found:
+                self.misses[key] = 0
+                if not health.present.is_set():
+                    health.returned()
+                continue
+            self.misses[key] = self.misses.get(key, 0) + 1
+            if (self.misses[key] >= Settings.TOPOLOGY_MISSES
+                    and health.present.is_set()):
+                health.gone()
+
+        for addr in sorted(found - set(known) - self.foreign[bus.index]):
+            com = hex(addr).replace("0x", "")
+            threadid = len(workers)
+            name = worker_name(bus, com)
+            bus.slaves.append(com)
+            # stats first, metrics pair workers and slave_stats up
+            slave_stats.append(SlaveStats(name))
+            workers.append((bus, com))
+            pretty_print("sys" + name,
+                         f" New I2CS found on {bus.port}, starting worker",
+                         "success")
+            self.spawn(com, threadid, self.fastest_pool, bus)
+
+
+def stats_totals():
+    """
+    Rig totals over the SlaveStats of every I2CS
+    """
+    totals = dict.fromkeys(("accepted", "rejected", "blocks", "bad_crc8",
+                            "i2c_retries", "hashrate"), 0)
+    for stats in slave_stats:
+        for key in totals:
+            totals[key] += getattr(stats, key)
+    return totals
+
+
+def phase_totals():
+    """
+    Phase histograms merged over every I2CS
+    """
+    totals = {phase: Histogram() for phase in Settings.PHASES}
+    for stats in slave_stats:
+        for phase, histogram in stats.phases.items():
+            totals[phase].merge(histogram)
+    return totals
+
+
+def phases_json():
+    return json.dumps({stats.name: {phase: histogram.to_dict()
+                                    for phase, histogram
+                                    in stats.phases.items()}
+                       for stats in slave_stats})
+
+
+class PeriodicReport:
+    """
+    Bookkeeping for the periodic mining report printed by worker 0
+    """
+    def __init__(self):
+        self.start_time = time()
+        self.last = stats_totals()
+
+    def tick(self, motd):
+        if ramp is not None:
+            ramp.full()
+        end_time = time()
+        if end_time - self.start_time < Settings.REPORT_TIME:
+            return
+
+        totals = stats_totals()
+        report_shares = totals["accepted"] - self.last["accepted"]
+        report_bad_crc8 = totals["bad_crc8"] - self.last["bad_crc8"]
+        report_i2c_retry_count = (totals["i2c_retries"]
+                                  - self.last["i2c_retries"])
+        uptime = calculate_uptime(mining_start_time)
+        pretty_print("net0",
+                     " POOL_INFO: " + Fore.RESET
+                     + Style.NORMAL + str(motd),
+                     "success")
+        periodic_report(self.start_time, end_time, report_shares,
+                        totals["blocks"], totals["hashrate"], uptime,
+                        report_bad_crc8, report_i2c_retry_count,
+                        [(bus.port, bus.utilization()) for bus in buses],
+                        [(phase, histogram.quantile(0.5),
+                          histogram.quantile(0.9))
+                         for phase, histogram in phase_totals().items()
+                         if histogram.count])
+
+        self.start_time = time()
+        self.last = totals
+
+
+class RampUp:
+    """
+    Starts the workers in batches instead of one every DELAY_START.
+    The workers of a batch start at random offsets within DELAY_START
+    seconds, so their shares stay out of step. Batches grow with the
+    measured capacity: the next one is capped by the I2CS the busiest
+    adaptor has room for below RAMP_BUS_MAX and halves when the pool
+    slows down
+    """
+    def __init__(self, count):
+        self.count = count
+        self.size = Settings.RAMP_BATCH
+        self.started_at = time()
+        self.full_after = None
+        # mean job round trip of the first batch
+        self.job_time = None
+        self.batch_at = 0
+        self.busy = {}
+
+    def plan(self, first):
+        """
+        (threadid, offset) of the batch starting at worker first
+        """
+        self.batch_at = time()
+        self.busy = {bus.index: bus.busy_time for bus in buses}
+        return sorted(((threadid, uniform(0, Settings.DELAY_START))
+                       for threadid in range(
+                           first, min(self.count, first + self.size))),
+                      key=lambda start: start[1])
+
+    def settled(self, batch):
+        if time() - self.batch_at > Settings.RAMP_SETTLE_MAX:
+            return True
+        return all(slave_stats[threadid].phases["upload"].count
+                   for threadid, _ in batch)
+
+    def resize(self, batch, started):
+        elapsed = max(time() - self.batch_at, 1e-9)
+        # workers the busiest adaptor can still take
+        room = self.size * 2
+        for bus in buses:
+            running = sum(1 for worker_bus, _ in workers[:started]
+                          if worker_bus is bus)
+            busy = (bus.busy_time - self.busy.get(bus.index, 0)) / elapsed
+            if running and busy > 0:
+                room = min(room, int((Settings.RAMP_BUS_MAX - busy)
+                                     * running / busy))
+
+        jobs = Histogram()
+        for threadid, _ in batch:
+            jobs.merge(slave_stats[threadid].phases["job"])
+        job_time = jobs.total / jobs.count if jobs.count else None
+        if self.job_time is None:
+            self.job_time = job_time
+        slow = (job_time is not None and self.job_time
+                and job_time > self.job_time * Settings.RAMP_POOL_SLOWDOWN)
+
+        self.size = max(1, self.size // 2 if slow else room)
+        debug_output(f'Ramp-up: next batch of {self.size}, job round trip '
+                     f'{job_time}, room {room}')
+
+    def full(self):
+        """
+        Seconds from the start until every worker submitted a share,
+        None while the ramp is still going. Unhealthy I2CS don't count
+        """
+        if self.full_after is None and all(
+                stats.hashrate or stats.health.off_bus()
+                for stats in slave_stats[:self.count]):
+            self.full_after = round(time() - self.started_at, 1)
+            pretty_print("sys0",
+                         f" All {self.count} worker(s) hashing after "
+                         + f"{self.full_after}s",
+                         "success")
+        return self.full_after
+
+
+class ResultPoller:
+    """
+    Poll schedule for the result of one I2CS. The nonce of a
+    DUCO-S1 job is uniform in [0, diff*100], so with the measured
+    hashrate of the I2CS the result is expected after diff*50/hashrate
+    seconds and due at the latest after twice that
+    """
+    __slots__ = ("quiet_until", "deadline", "interval")
+
+    def __init__(self):
+        self.quiet_until = 0
+        self.deadline = 0
+        self.interval = Settings.POLL_INTERVAL_MIN
+
+    def start(self, diff, hashrate):
+        # called when a job is loaded on the I2CS
+        try:
+            expected = int(diff) * 50 / hashrate
+        except (ValueError, ZeroDivisionError):
+            expected = 0
+        start_time = time()
+        self.quiet_until = start_time + expected * Settings.POLL_QUIET
+        self.deadline = start_time + expected * 2 if expected else 0
+        self.interval = Settings.POLL_INTERVAL_MIN
+
+    def next_due(self):
+        now_t = time()
+        if not self.deadline:
+            # hashrate not measured yet
+            return now_t + Settings.POLL_INTERVAL
+        if now_t < self.quiet_until:
+            return self.quiet_until
+        if now_t >= self.deadline:
+            # overdue, the I2CS is slower than measured
+            return now_t + Settings.POLL_INTERVAL_MIN
+        due = min(now_t + self.interval, self.deadline)
+        self.interval = min(self.interval * Settings.POLL_BACKOFF,
+                            Settings.POLL_INTERVAL_MAX)
+        return due
+
+
+def avr_worker(com, threadid, fastest_pool, bus):
+    """
+    Mining loop of one I2CS: job, upload, poll, verify, submit.
+    A generator of I/O steps, mine_avr and mine_avr_async run
+    it on their engine
+    """
+    report = PeriodicReport()
+    poller = ResultPoller()
+    verifier = ResultVerifier()
+    motd = ""
+    addr = int(com, base=16)
+    name = worker_name(bus, com)
+    stats = slave_stats[threadid]
+    _com = hex(addr).replace("0x","")
+    bus.responses[_com] = ""
     
     while True:
-        
+        if stats.health.state == "quarantined":
+            yield from quarantine_wait(
+                bus, addr, stats.health,
+                lambda: threadid == 0 and report.tick(motd))
+        if not stats.health.present.is_set():
+            yield from absent_wait(
+                stats.health, lambda: threadid == 0 and report.tick(motd))
+            continue
+
         retry_counter = 0
         while True:
             try:
                 if retry_counter > 3:
-                    fastest_pool = Client.fetch_pool()
+                    fastest_pool = yield ("fetch_pool", fastest_pool)
                     retry_counter = 0
+                elif node_resolver.node:
+                    # (re)connect to the node selected by the probes
+                    fastest_pool = node_resolver.node
 
                 debug_output(f'Connecting to {fastest_pool}')
-                s = Client.connect(fastest_pool)
-                server_version = Client.recv(s, 6)
+                conn = yield ("connect", fastest_pool)
+                server_version = yield from conn.readline(
+                    settle=Settings.SOC_SETTLE)
 
                 if threadid == 0:
-                    if float(server_version) <= float(Settings.VER):
-                        pretty_print(
-                            'net0', get_string('connected')
-                            + Style.NORMAL + Fore.RESET
-                            + get_string('connected_server')
-                            + str(server_version) + ")",
-                            'success')
-                    else:
-                        pretty_print(
-                            'sys0', f"{get_string('miner_is_outdated')} (v{Settings.VER}) -"
-                            + get_string('server_is_on_version')
-                            + server_version + Style.NORMAL
-                            + Fore.RESET + get_string('update_warning'),
-                            'warning')
-                        sleep(10)
-
-                    Client.send(s, "MOTD")
-                    motd = Client.recv(s, 1024)
-
-                    if "\n" in motd:
-                        motd = motd.replace("\n", "\n\t\t")
-
-                    pretty_print("net" + str(threadid),
-                                 get_string("motd") + Fore.RESET
-                                 + Style.NORMAL + str(motd),
-                                 "success")
+                    if server_version_print(server_version):
+                        yield ("sleep", 10)
+
+                    yield ("send", conn, "MOTD")
+                    motd = motd_print(threadid, (yield from conn.read_idle()))
                 break
             except Exception as e:
                 pretty_print('net0', get_string('connecting_error')
                              + Style.NORMAL + f' (connection err: {e})',
                              'error')
                 retry_counter += 1
-                sleep(10)
+                yield ("sleep", 10)
 
-        pretty_print('sys' + port_num(com),
+        pretty_print('sys' + name,
                      get_string('mining_start') + Style.NORMAL + Fore.RESET
-                     + get_string('mining_algorithm') + str(com) + ')',
+                     + get_string('mining_algorithm') + name + ')',
                      'success')
 
-        flush_i2c(ser,com)
-                
+        # the I2CS is flushed inside the next job attempt, so a bus
+        # error there takes the retry and health path of read errors
+        flush = True
+        # second pool connection and the job prefetched on it
+        spare = None
+        next_job = None
+        preloaded = False
         while True:
-            try:
-                
-                if config["AVR Miner"]["mining_key"] != "None":
-                    key = b64.b64decode(config["AVR Miner"]["mining_key"]).decode("utf-8")
-                else:
-                    key = config["AVR Miner"]["mining_key"]
-                    
-                debug_output(com + ': Requesting job')
-                Client.send(s, 'JOB'
-                            + Settings.SEPARATOR
-                            + str(username)
-                            + Settings.SEPARATOR
-                            + 'AVR'
-                            + Settings.SEPARATOR
-                            + str(key)
-                )
-                job = Client.recv(s, 128).split(Settings.SEPARATOR)
-                debug_output(com + f": Received: {job[0]}")
-
+            if not preloaded:
                 try:
-                    diff = int(job[2])
-                except:
-                    pretty_print("sys" + port_num(com),
-                                 f" Node message: {job[1]}", "warning")
-                    sleep(3)
-            except Exception as e:
-                pretty_print('net' + port_num(com),
-                             get_string('connecting_error')
-                             + Style.NORMAL + Fore.RESET
-                             + f' (err handling result: {e})', 'error')
-                sleep(3)
-                break
+                    debug_output(name + ': Requesting job')
+                    job_start = perf_counter()
+                    yield ("send", conn, job_request())
+                    job = (yield from conn.readline()).split(Settings.SEPARATOR)
+                    stats.phase("job", perf_counter() - job_start)
+                    debug_output(name + f": Received: {job[0]}")
+
+                    try:
+                        diff = int(job[2])
+                    except:
+                        pretty_print("sys" + name,
+                                     f" Node message: {job[1]}", "warning")
+                        yield ("sleep", 3)
+                except Exception as e:
+                    pretty_print('net' + name,
+                                 get_string('connecting_error')
+                                 + Style.NORMAL + Fore.RESET
+                                 + f' (err handling result: {e})', 'error')
+                    yield ("sleep", 3)
+                    break
 
             retry_counter = 0
             while True:
                 if retry_counter > 10:
-                    flush_i2c(ser,com)
+                    flush = True
                     break
 
                 try:
-                    debug_output(com + ': Sending job to the board')
-                    i2c_data = str(job[0]
-                                    + Settings.SEPARATOR
-                                    + job[1]
-                                    + Settings.SEPARATOR
-                                    + job[2]
-                                    + Settings.SEPARATOR)
-                                    
-                    if Settings.CRC8_EN == "y":
-                        i2c_data = str(i2c_data + str(crc8(i2c_data.encode())) + '\n')
-                        debug_output(com + f': Job+crc8: {i2c_data}')
+                    if flush:
+                        # a flush clears the I2CS, a preloaded job is lost
+                        preloaded = False
+                        yield from flush_i2c(bus,com)
+                        flush = False
+
+                    if preloaded and retry_counter == 0:
+                        debug_output(name + ': Job already loaded on the board')
                     else:
-                        i2c_data = str(i2c_data + '\n')
-                        debug_output(com + f': Job: {i2c_data}')
+                        debug_output(name + ': Sending job to the board')
+                        i2c_data = job_frame(name, job)
                                     
-                    with thread_lock():
-                        for i in range(0, len(i2c_data)):
-                            try:
-                                usbi2c_write(ser,int(com, base=16),i2c_data[i])
-                                sleep(0.02)
-                            except Exception as e:
-                                debug_output(com + f': {e}')
-                                pass
-                    debug_output(com + ': Reading result from the board')
-                    i2c_responses = ''
+                        upload_start = perf_counter()
+                        try:
+                            yield from usbi2c_send(bus,addr,i2c_data)
+                        except Exception as e:
+                            debug_output(name + f': {e}')
+                        loaded_at = perf_counter()
+                        stats.phase("upload", loaded_at - upload_start)
+                        poller.start(job[2], stats.hashrate)
+                        verifier.prepare(job)
+
+                    # no prefetch from a node the worker is moving away from
+                    if (Settings.JOB_PREFETCH == "y" and next_job is None
+                            and node_resolver.node in (None, fastest_pool)):
+                        spare, next_job = yield from prefetch_job(
+                            name, spare, fastest_pool)
+                    debug_output(name + ': Reading result from the board')
                     i2c_rdata = []
                     result = []
-                    result_pool[_com] = ""
+                    bus.responses[_com] = ""
                     i2c_start_time = time()
-                    sleep_en = True
+                    polling = True
+                    poll_due = poller.next_due()
                     while True:
-                        with thread_lock():
-                            try:
-                                i2c_rdata = usbi2c_read(ser, int(com, base=16))
-                            except Exception as e:
-                                debug_output(com + f': {e}')
-                                pass
+                        try:
+                            i2c_rdata = yield (
+                                "bus", bus, "read", addr, None,
+                                (Settings.BUS_PRIO_POLL if polling
+                                 else Settings.BUS_PRIO_DRAIN),
+                                poll_due)
+                        except Exception as e:
+                            debug_output(name + f': {e}')
                                 
                         # put i2c_rdata into their respective worker response
-                        i2cs_raddr = hex(int(i2c_rdata[0],base=16)).replace("0x","")
-                            
-                        if ((i2c_rdata[1].isalnum()) or (',' in i2c_rdata[1])):
-                            sleep_en = False
-                            result_pool[i2cs_raddr] += i2c_rdata[1].strip()
-                        elif ('#' in i2c_rdata[1]):
-                            flush_i2c(ser,com)
+                        i2cs_raddr, state = i2c_collect(bus, i2c_rdata)
+                        if state == "data":
+                            if polling:
+                                drain_start = perf_counter()
+                                stats.phase("first_byte",
+                                            drain_start - loaded_at)
+                            polling = False
+                            poll_due = 0
+                        elif state == "corrupted":
+                            yield from flush_i2c(bus,com)
                                                                                        
-                            debug_output(com + f': Retry Job: {job}')
+                            debug_output(name + f': Retry Job: {job}')
                             raise Exception("I2C data corrupted")
-                        elif sleep_en:
-                            # feel free to play around this number to find sweet spot for shares/s vs. stability
-                            sleep(0.05)
+                        elif polling:
+                            # bus serves other I2CS until the next poll is due
+                            poll_due = poller.next_due()
                             
-                        result = result_pool[i2cs_raddr].split(',')
-                        if ((len(result)==4) and ('\n' in i2c_rdata[1]) and (Settings.CRC8_EN == "y")):
-                            debug_output(com + " i2c_responses:" + f'{result_pool[i2cs_raddr]}')
-                            break
-                        
-                        elif ((len(result)==3) and ('\n' in i2c_rdata[1]) and (Settings.CRC8_EN == "n")):
-                            debug_output(com + " i2c_responses:" + f'{i2c_responses}')
+                        result = i2c_result(bus, name, i2cs_raddr, i2c_rdata)
+                        if result:
+                            stats.phase("drain", perf_counter() - drain_start)
                             break
                             
                         i2c_end_time = time()
                         if (i2c_end_time - i2c_start_time) > Settings.AVR_TIMEOUT:
-                            flush_i2c(ser,com)
-                            debug_output(com + ' I2C timed out')
+                            yield from flush_i2c(bus,com)
+                            stats.timeouts += 1
+                            debug_output(name + ' I2C timed out')
                             raise Exception("I2C timed out")
 
-                    if result[0] and result[1]:
-                        _ = int(result[0])
-                        if not _:
-                            debug_output(com + ' Invalid result')
-                            raise Exception("Invalid result")
-                        _ = int(result[1])
-                        if not result[2].isalnum():
-                            debug_output(com + ' Corrupted DUCOID')
-                            raise Exception("Corrupted DUCOID")
-                        if Settings.CRC8_EN == "y":
-                            _resp = result_pool[i2cs_raddr].rpartition(Settings.SEPARATOR)[0]+Settings.SEPARATOR
-                            result_crc8 = crc8(_resp.encode())
-                            if int(result[3]) != result_crc8:
-                                bad_crc8 += 1
-                                debug_output(com + f': crc8:: expect:{result_crc8} measured:{result[3]}')
-                                raise Exception("crc8 checksum failed")
-                        break
-                    else:
-                        raise Exception("No data received from AVR")
+                    crc_start = perf_counter()
+                    check_result(bus, name, i2cs_raddr, result, stats)
+                    verify_result(verifier, name, job, result, stats)
+                    stats.phase("crc", perf_counter() - crc_start)
+                    break
                 except Exception as e:
-                    debug_output(com + f': Retrying data read: {e}')
+                    debug_output(name + f': Retrying data read: {e}')
                     retry_counter += 1
-                    i2c_retry_count += 1
-                    #flush_i2c(ser,com,1)
+                    stats.i2c_retries += 1
+                    stats.health.update(stats)
+                    if stats.health.off_bus():
+                        break
+                    # a degraded I2CS leaves the bus to the others
+                    yield ("sleep", stats.health.backoff())
                     continue
 
+            if stats.health.off_bus():
+                break
+            preloaded = False
             try:
-                computetime = round(int(result[1]) / 1000000, 5)
-                num_res = int(result[0])
-                hashrate_t = round(num_res / computetime, 2)
-
-                hashrate_mean.append(hashrate_t)
-                hashrate = mean(hashrate_mean[-5:])
-                hashrate_list[threadid] = hashrate
+                computetime, num_res, hashrate_t = result_hashrate(stats, result)
             except Exception as e:
-                pretty_print('sys' + port_num(com),
+                pretty_print('sys' + name,
                              get_string('mining_avr_connection_error')
                              + Style.NORMAL + Fore.RESET
                              + ' (no response from the board: '
                              + f'{e}, please check the connection, '
                              + 'port setting or reset the AVR)', 'warning')
-                debug_output(com + f': Retry count: {retry_counter}')
-                debug_output(com + f': Job: {job}')
-                debug_output(com + f': Result: {result}')
-                flush_i2c(ser,com)
+                debug_output(name + f': Retry count: {retry_counter}')
+                debug_output(name + f': Job: {job}')
+                debug_output(name + f': Result: {result}')
+                flush = True
                 break
 
+            if next_job:
+                # hand the I2CS its next job before the result round trip
+                if prefetch_fresh(name, next_job):
+                    try:
+                        upload_start = perf_counter()
+                        yield from usbi2c_send(
+                            bus,addr,job_frame(name, next_job[0]))
+                        loaded_at = perf_counter()
+                        stats.phase("upload", loaded_at - upload_start)
+                        poller.start(next_job[0][2], stats.hashrate)
+                        verifier.prepare(next_job[0])
+                        preloaded = True
+                    except Exception as e:
+                        debug_output(name + f': {e}')
+                if not preloaded:
+                    yield ("close", spare)
+                    spare = None
+                    next_job = None
+
             try:
-                Client.send(s, str(num_res)
-                            + Settings.SEPARATOR
-                            + str(hashrate_t)
-                            + Settings.SEPARATOR
-                            + f'USBI2C AVR Miner {Settings.VER}'
-                            + Settings.SEPARATOR
-                            + str(rig_identifier)
-                            + str(port_num(com))
-                            + Settings.SEPARATOR
-                            + str(result[2]))
-
-                responsetimetart = now()
-                feedback = Client.recv(s, 64).split(",")
-                responsetimestop = now()
-
-                time_delta = (responsetimestop -
-                              responsetimetart).microseconds
-                ping_mean.append(round(time_delta / 1000))
-                ping = mean(ping_mean[-10:])
+                submit_start = perf_counter()
+                yield ("send", conn,
+                       result_line(name, num_res, hashrate_t, result))
+                feedback = (yield from conn.readline()).split(",")
+                submit_time = perf_counter() - submit_start
+
+                stats.phase("submit", submit_time)
+                stats.add_ping(round(submit_time * 1000))
+                ping = stats.ping
                 diff = get_prefix("", int(diff), 0)
-                debug_output(com + f': retrieved feedback: {" ".join(feedback)}')
+                debug_output(name + f': retrieved feedback: {" ".join(feedback)}')
             except Exception as e:
-                pretty_print('net' + port_num(com),
+                pretty_print('net' + name,
                              get_string('connecting_error')
                              + Style.NORMAL + Fore.RESET
                              + f' (err handling result: {e})', 'error')
-                debug_output(com + f': error parsing response: {e}')
-                sleep(5)
+                debug_output(name + f': error parsing response: {e}')
+                yield ("sleep", 5)
                 break
 
-            if feedback[0] == 'GOOD':
-                shares[0] += 1
-                share_print(port_num(com), "accept",
-                            shares[0], shares[1], hashrate,
-                            computetime, diff, ping)
-            elif feedback[0] == 'BLOCK':
-                shares[0] += 1
-                shares[2] += 1
-                share_print(port_num(com), "block",
-                            shares[0], shares[1], hashrate,
-                            computetime, diff, ping)
-            elif feedback[0] == 'BAD':
-                shares[1] += 1
-                reason = feedback[1] if len(feedback) > 1 else None
-                share_print(port_num(com), "reject",
-                            shares[0], shares[1], hashrate_t,
-                            computetime, diff, ping, reason)
-            else:
-                shares[1] += 1
-                share_print(port_num(com), "reject",
-                            shares[0], shares[1], hashrate_t,
-                            computetime, diff, ping, feedback)
-                debug_output(com + f': Job: {job}')
-                debug_output(com + f': Result: {result}')
-                flush_i2c(ser,com,5)
-
-            title(get_string('duco_avr_miner') + str(Settings.VER)
-                  + f') - {shares[0]}/{(shares[0] + shares[1])}'
-                  + get_string('accepted_shares'))
-
-            end_time = time()
-            elapsed_time = end_time - start_time
-            if threadid == 0 and elapsed_time >= Settings.REPORT_TIME:
-                report_shares = shares[0] - last_report_share
-                report_bad_crc8 = bad_crc8 - last_bad_crc8
-                report_i2c_retry_count = i2c_retry_count - last_i2c_retry_count
-                uptime = calculate_uptime(mining_start_time)
-                pretty_print("net" + str(threadid),
-                                 " POOL_INFO: " + Fore.RESET
-                                 + Style.NORMAL + str(motd),
-                                 "success")
-                periodic_report(start_time, end_time, report_shares,
-                                shares[2], hashrate, uptime, 
-                                report_bad_crc8, report_i2c_retry_count)
-                
-                start_time = time()
-                last_report_share = shares[0]
-                last_bad_crc8 = bad_crc8
-                last_i2c_retry_count = i2c_retry_count
+            if not share_feedback(name, feedback, hashrate_t,
+                                  computetime, diff, ping, stats):
+                debug_output(name + f': Job: {job}')
+                debug_output(name + f': Result: {result}')
+                flush = True
+            stats.health.update(stats)
+
+            if preloaded:
+                # prefetched job is on the board, its connection becomes
+                # the main one and the free connection prefetches next
+                job = next_job[0]
+                diff = int(job[2])
+                next_job = None
+                conn, spare = spare, conn
+
+            if threadid == 0:
+                report.tick(motd)
+
+            if not preloaded and node_resolver.migrate(fastest_pool):
+                fastest_pool = node_resolver.node
+                debug_output(name + f': Moving to node {fastest_pool}')
+                break
+
+        yield ("close", spare)
+        yield ("close", conn)
+
+
+class ThreadIO:
+    """
+    Blocking I/O layer of the threaded engine, runs the steps
+    yielded by a worker generator on the calling thread.
+    The socket of a LineReader is a plain socket
+    """
+    def run(steps):
+        """
+        Drive the generator until it returns. A step that
+        raises is thrown back into the generator at its yield
+        """
+        value, error = None, None
+        while True:
+            try:
+                if error is None:
+                    step = steps.send(value)
+                else:
+                    step = steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value = getattr(ThreadIO, step[0])(*step[1:])
+                error = None
+            except Exception as e:
+                value, error = None, e
+
+    def sleep(seconds):
+        sleep(seconds)
+
+    def bus(bus, kind, addr=0, data=None, priority=None, due=0):
+        return bus.submit(kind, addr, data, priority, due).result()
+
+    def wait(future, timeout):
+        # result of a bus transaction, None while it is not done
+        try:
+            return future.result(timeout)
+        except future_timeout:
+            return None
+
+    def connect(pool):
+        return LineReader(Client.connect(pool))
+
+    def send(conn, msg):
+        return Client.send(conn.s, msg)
+
+    def recv(conn, timeout):
+        conn.s.settimeout(timeout)
+        try:
+            return conn.s.recv(Settings.SOC_RECV_SIZE)
+        except socket_timeout:
+            return None
+
+    def close(conn):
+        # conn is a LineReader or None
+        if conn is None:
+            return
+        try:
+            conn.s.close()
+        except Exception:
+            pass
+
+    def fetch_pool(stale):
+        return Client.fetch_pool(stale)
+
+
+class PoolProtocol(asyncio.Protocol):
+    """
+    Pool connection of the asyncio engine. Received data waits
+    here until the worker reads it, a read that has to wait
+    arms one timer instead of running in a task of its own
+    """
+    def __init__(self):
+        self.transport = None
+        self.data = b""
+        self.eof = False
+        self.waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.data += data
+        self.wake()
+
+    def connection_lost(self, exc):
+        self.eof = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def recv(self, timeout):
+        """
+        Data received so far, b"" once the node closed
+        the connection, None when the timeout passed
+        """
+        if not self.data and not self.eof:
+            loop = asyncio.get_running_loop()
+            self.waiter = loop.create_future()
+            timer = loop.call_later(timeout, self.wake)
+            try:
+                await self.waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+            if not self.data and not self.eof:
+                return None
+        data, self.data = self.data, b""
+        return data
+
+
+class AsyncIO:
+    """
+    asyncio I/O layer, runs the steps yielded by a worker generator
+    on the event loop. The socket of a LineReader is a PoolProtocol
+    """
+    async def run(steps):
+        value, error = None, None
+        while True:
+            try:
+                if error is None:
+                    step = steps.send(value)
+                else:
+                    step = steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                value = await getattr(AsyncIO, step[0])(*step[1:])
+                error = None
+            except Exception as e:
+                value, error = None, e
+
+    async def sleep(seconds):
+        await asyncio.sleep(seconds)
+
+    def bus(bus, kind, addr=0, data=None, priority=None, due=0):
+        # the future of the event loop is awaited by run() directly
+        return bus.submit(kind, addr, data, priority, due,
+                          asyncio.get_running_loop())
+
+    async def wait(future, timeout):
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def connect(pool):
+        _, protocol = await asyncio.wait_for(
+            asyncio.get_running_loop().create_connection(
+                PoolProtocol, *pool), Settings.SOC_TIMEOUT)
+        return LineReader(protocol)
+
+    async def send(conn, msg):
+        if conn.s.eof:
+            raise Exception("Connection closed by the node")
+        # lines to the node are short, no need to wait for a drain
+        conn.s.transport.write(str(msg).encode(Settings.ENCODING))
+        return True
+
+    def recv(conn, timeout):
+        return conn.s.recv(timeout)
+
+    async def close(conn):
+        if conn is None:
+            return
+        try:
+            conn.s.transport.close()
+        except Exception:
+            pass
+
+    async def fetch_pool(stale):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, Client.fetch_pool, stale)
+
+
+def worker_failed(bus, com, e):
+    pretty_print('sys' + worker_name(bus, com),
+                 f' Worker failed ({e}), restarting in '
+                 + f'{Settings.WORKER_RESTART_TIME}s', 'error')
+
+
+def mine_avr(com, threadid, fastest_pool, bus):
+    """
+    Worker thread of one I2CS, restarted when it fails
+    """
+    while True:
+        try:
+            ThreadIO.run(avr_worker(com, threadid, fastest_pool, bus))
+        except Exception as e:
+            worker_failed(bus, com, e)
+        sleep(Settings.WORKER_RESTART_TIME)
+
+
+async def mine_avr_async(com, threadid, fastest_pool, bus):
+    """
+    asyncio version of mine_avr, one coroutine per I2CS. A worker
+    that fails is restarted instead of ending the event loop with
+    every other worker on it
+    """
+    while True:
+        try:
+            await AsyncIO.run(avr_worker(com, threadid, fastest_pool, bus))
+        except Exception as e:
+            worker_failed(bus, com, e)
+        await asyncio.sleep(Settings.WORKER_RESTART_TIME)
+
+
+async def mine_async(fastest_pool):
+    """
+    asyncio engine, runs every I2CS worker as a coroutine
+    on a single event loop thread
+    """
+    global ramp
+    tasks = []
+    ramp = RampUp(len(workers))
+    threadid = 0
+    while threadid < len(workers):
+        batch = ramp.plan(threadid)
+        for started, offset in batch:
+            await asyncio.sleep(max(0, ramp.batch_at + offset - time()))
+            bus, port = workers[started]
+            tasks.append(asyncio.create_task(
+                mine_avr_async(port, started, fastest_pool, bus)))
+        threadid += len(batch)
+        if threadid != len(workers):
+            pretty_print('sys0',
+                            f" Started {threadid}/{len(workers)} worker(s), next batch once these are loaded",
+                            "success")
+            while not ramp.settled(batch):
+                await asyncio.sleep(1)
+            ramp.resize(batch, threadid)
+        else:
+            pretty_print('sys0',
+                            f" All {threadid}/{len(workers)} worker(s) started",
+                            "success")
+    if Settings.TOPOLOGY_INTERVAL:
+        loop = asyncio.get_running_loop()
+        Topology(fastest_pool,
+                 lambda *args: asyncio.run_coroutine_threadsafe(
+                     mine_avr_async(*args), loop)).start()
+    await asyncio.gather(*tasks)
 
 
 def periodic_report(start_time, end_time, shares,
-                    blocks, hashrate, uptime, bad_crc8, i2c_retry_count):
+                    blocks, hashrate, uptime, bad_crc8, i2c_retry_count,
+                    bus_utilization=(), phase_latency=()):
     seconds = round(end_time - start_time)
     pretty_print("sys0", " " + get_string("periodic_mining_report")
                  + Fore.RESET + Style.NORMAL
@@ -1278,7 +3311,236 @@ def periodic_report(start_time, end_time, shares,
                  + get_string("total_mining_time") 
                  + str(uptime)
                  + "\n\t\t‖ CRC8 Error Rate: " + str(round(bad_crc8/seconds, 6)) + " E/s"
-                 + "\n\t\t‖ I2C Retry Rate: " + str(round(i2c_retry_count/seconds, 6)) + " R/s", "success")
+                 + "\n\t\t‖ I2C Retry Rate: " + str(round(i2c_retry_count/seconds, 6)) + " R/s"
+                 + "".join("\n\t\t‖ USBI2C Bus Utilization: " + str(port) + " "
+                           + str(round(utilization*100, 1)) + "%"
+                           for port, utilization in bus_utilization)
+                 + ("\n\t\t‖ Phase p50/p90: " + " ∙ ".join(
+                     f"{phase} {round(p50*1000)}/{round(p90*1000)}ms"
+                     for phase, p50, p90 in phase_latency)
+                    if phase_latency else ""), "success")
+
+
+def metrics_text():
+    """
+    Prometheus text exposition of the per I2CS and per adaptor
+    counters. Reads the counters as they are, without locks, so
+    a scrape never holds up the workers or the bus
+    """
+    def label(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+    slaves = [(f'slave="{label(stats.name)}",adaptor="{label(bus.port)}"',
+               stats)
+              for (bus, _), stats in zip(workers, slave_stats)]
+    families = [
+        ("duco_avr_accepted_shares_total", "counter", "Accepted shares",
+         [(l, st.accepted) for l, st in slaves]),
+        ("duco_avr_rejected_shares_total", "counter", "Rejected shares",
+         [(l, st.rejected) for l, st in slaves]),
+        ("duco_avr_blocks_total", "counter", "Blocks found",
+         [(l, st.blocks) for l, st in slaves]),
+        ("duco_avr_hashrate_hps", "gauge", "Rolling hashrate",
+         [(l, st.hashrate) for l, st in slaves]),
+        ("duco_avr_compute_seconds", "gauge", "Compute time of the last share",
+         [(l, st.computetime) for l, st in slaves]),
+        ("duco_avr_pool_ping_seconds", "gauge", "Rolling share submit ping",
+         [(l, st.ping / 1000) for l, st in slaves]),
+        ("duco_avr_i2c_retries_total", "counter", "I2C result read retries",
+         [(l, st.i2c_retries) for l, st in slaves]),
+        ("duco_avr_crc8_errors_total", "counter", "Results failing CRC8",
+         [(l, st.bad_crc8) for l, st in slaves]),
+        ("duco_avr_bad_results_total", "counter",
+         "Results failing host side DUCO-S1 verification",
+         [(l, st.bad_results) for l, st in slaves]),
+        ("duco_avr_i2c_timeouts_total", "counter", "Result reads timed out",
+         [(l, st.timeouts) for l, st in slaves]),
+        ("duco_avr_health_score", "gauge",
+         "Moving average fault rate of job attempts",
+         [(l, round(st.health.score, 4)) for l, st in slaves]),
+        ("duco_avr_health_state", "gauge",
+         "0 healthy, 1 degraded, 2 quarantined, 3 absent",
+         [(l, SlaveHealth.STATES.index(st.health.status()))
+          for l, st in slaves]),
+        ("duco_avr_quarantines_total", "counter", "Times quarantined",
+         [(l, st.health.quarantines) for l, st in slaves]),
+    ]
+    # set by the periodic report of worker 0
+    if ramp is not None and ramp.full_after is not None:
+        families.append(
+            ("duco_avr_ramp_seconds", "gauge",
+             "Seconds from the start until every worker was hashing",
+             [("", ramp.full_after)]))
+
+    now_t = time()
+    adaptors = [(f'adaptor="{label(bus.port)}"', bus) for bus in buses]
+    families += [
+        ("duco_usbi2c_sent_bytes_total", "counter", "Bytes written to the adaptor",
+         [(l, bus.bytes_out) for l, bus in adaptors]),
+        ("duco_usbi2c_received_bytes_total", "counter", "Bytes read from the adaptor",
+         [(l, bus.bytes_in) for l, bus in adaptors]),
+        ("duco_usbi2c_transactions_total", "counter", "Bus transactions served",
+         [(l, bus.transactions) for l, bus in adaptors]),
+        ("duco_usbi2c_busy_seconds_total", "counter", "Time the serial port was busy",
+         [(l, bus.busy_time) for l, bus in adaptors]),
+        ("duco_usbi2c_busy_ratio", "gauge", "Busy fraction since the bus started",
+         [(l, min(1, bus.busy_time / max(now_t - bus.started_at, 1e-9)))
+          for l, bus in adaptors]),
+        ("duco_usbi2c_baudrate", "gauge", "Serial baudrate of the adaptor",
+         [(l, bus.ser.baudrate) for l, bus in adaptors]),
+        ("duco_usbi2c_i2c_clock_hz", "gauge", "I2C clock of the adaptor",
+         [(l, bus.i2c_clock) for l, bus in adaptors]),
+        ("duco_usbi2c_i2cs_found", "gauge",
+         "I2CS found by the last background bus scan",
+         [(l, len(bus.found)) for l, bus in adaptors if bus.scanned_at]),
+    ]
+
+    # snapshot published by the resolver, a scrape takes no lock
+    selected, published = node_resolver.published
+    nodes = [(f'node="{label(node[0])}:{node[1]}"', node, rtt, errors)
+             for node, rtt, errors in published]
+    families += [
+        ("duco_pool_node_rtt_seconds", "gauge",
+         "Moving average version banner RTT",
+         [(l, round(rtt, 6)) for l, _, rtt, _ in nodes
+          if rtt is not None]),
+        ("duco_pool_node_error_ratio", "gauge",
+         "Moving average probe and connection failure rate",
+         [(l, round(errors, 4)) for l, _, _, errors in nodes]),
+        ("duco_pool_node_selected", "gauge",
+         "1 for the node new connections go to",
+         [(l, int(node == selected)) for l, node, _, _ in nodes]),
+    ]
+
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{{{labels}}} {value}")
+
+    name = "duco_avr_phase_seconds"
+    lines.append(f"# HELP {name} Share phase latency")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, stats in slaves:
+        for phase, histogram in stats.phases.items():
+            phase_labels = f'{labels},phase="{phase}"'
+            cumulative = 0
+            for bound, n in zip(list(Settings.LATENCY_BUCKETS) + ["+Inf"],
+                                histogram.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{phase_labels},le="{bound}"}}'
+                             f' {cumulative}')
+            lines.append(f"{name}_sum{{{phase_labels}}} {histogram.total}")
+            lines.append(f"{name}_count{{{phase_labels}}} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in ("/", "/metrics"):
+            body = metrics_text()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/phases.json":
+            body = phases_json()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode(Settings.ENCODING)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # every scrape would end up in the mining output
+        pass
+
+
+def start_metrics():
+    server = ThreadingHTTPServer((Settings.METRICS_HOST, Settings.METRICS_PORT),
+                                 MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    pretty_print("sys0",
+                 " Metrics at http://" + Settings.METRICS_HOST
+                 + ":" + str(Settings.METRICS_PORT) + "/metrics",
+                 "success")
+
+
+def open_adaptors():
+    """
+    Open every configured USBI2C adaptor and start its bus
+    scheduler. An adaptor that fails to open is reported
+    and skipped so the others keep mining
+    """
+    buses = []
+    for index, (port, baudrate, slaves) in enumerate(adaptors):
+        try:
+            ser = Serial(port, baudrate=baudrate,
+                         timeout=float(Settings.AVR_TIMEOUT))
+        except Exception as e:
+            pretty_print(
+                    'sys' + str(index),
+                    get_string('board_connection_error')
+                    + str(port)
+                    + get_string('board_connection_error2')
+                    + Style.NORMAL
+                    + Fore.RESET
+                    + f' (avr connection err: {e})',
+                    'error')
+            continue
+
+        version, caps = usbi2c_probe(ser, Settings.USBI2C_BOOT_TIME)
+        if version == "0.2" and Settings.BAUD_CALIBRATE == "y":
+            # an adaptor that was not reset when the port opened is
+            # still at the rate of the last calibration
+            cached = load_calibration().get(usbi2c_serial_number(port), {})
+            if cached.get("baudrate", baudrate) != baudrate:
+                version, caps = usbi2c_resync(ser, cached["baudrate"])
+                if version == "0.2":
+                    version, caps = usbi2c_resync(ser, baudrate)
+        if version == "0.2":
+            pretty_print('sys' + str(index),
+                         f" USBI2C adaptor {port} did not answer ver$,"
+                         + " assuming legacy firmware v0.2",
+                         "warning")
+        if "bd" in caps and Settings.BAUD_CALIBRATE == "y":
+            try:
+                usbi2c_calibrate(ser, port, version, baudrate)
+            except Exception as e:
+                pretty_print('sys' + str(index),
+                             f" USBI2C adaptor {port} calibration failed: {e}",
+                             "warning")
+        i2c_clock = 100000
+        if "clk" in caps:
+            i2c_clock = usbi2c_i2c_clock(ser, Settings.I2C_CLOCK) or i2c_clock
+            if i2c_clock != Settings.I2C_CLOCK:
+                pretty_print('sys' + str(index),
+                             f" USBI2C adaptor {port} refused I2C clock"
+                             + f" {Settings.I2C_CLOCK}",
+                             "warning")
+        elif Settings.I2C_CLOCK != i2c_clock:
+            pretty_print('sys' + str(index),
+                         f" USBI2C adaptor {port} firmware v{version}"
+                         + " has a fixed 100 kHz I2C clock",
+                         "warning")
+        bus = USBI2CBus(ser, version, caps, port, slaves, index, i2c_clock)
+        pretty_print('sys' + str(index),
+                     f" USBI2C adaptor {port} @ {ser.baudrate}"
+                     + f" I2C {i2c_clock // 1000} kHz"
+                     + f" firmware v{version}"
+                     + (" (bulk write)" if "bw" in caps
+                        else " (legacy per-byte write)")
+                     + (" (burst read)" if "br" in caps
+                        else " (legacy per-byte read)")
+                     + (" (binary framing)" if bus.binary else ""),
+                     "info")
+        buses.append(bus.start())
+    return buses
 
 
 def calculate_uptime(start_time):
@@ -1334,26 +3596,50 @@ if __name__ == '__main__':
             debug_output(f'Error launching donation thread: {e}')
 
     try:
-        ser = Serial(usbi2c_port, baudrate=int(Settings.BAUDRATE),
-                     timeout=float(Settings.AVR_TIMEOUT))
+        buses = open_adaptors()
+        workers = [(bus, com) for bus in buses for com in bus.slaves]
+        slave_stats = [SlaveStats(worker_name(bus, com))
+                       for bus, com in workers]
+        if Settings.METRICS_PORT:
+            try:
+                start_metrics()
+            except Exception as e:
+                pretty_print("sys0", f" Metrics endpoint failed: {e}",
+                             "warning")
         fastest_pool = Client.fetch_pool()
-        threadid = 0
-        for port in avrport:
-            Thread(target=mine_avr,
-                   args=(port, threadid,
-                         fastest_pool)).start()
-            threadid += 1
-            if ((len(avrport) > 1) and (threadid != len(avrport))):
-                pretty_print('sys' + str(threadid),
-                                f" Started {threadid}/{len(avrport)} worker(s). Next I2C AVR Miner starts in "
-                                + str(Settings.DELAY_START)
-                                + "s",
-                                "success")
-                sleep(Settings.DELAY_START)
-            else:
-                pretty_print('sys' + str(threadid),
-                                f" All {threadid}/{len(avrport)} worker(s) started",
-                                "success")
+        if Settings.NODE_PROBE_INTERVAL:
+            node_resolver.start()
+        if Settings.ENGINE == "asyncio":
+            debug_output('Using asyncio mining engine')
+            Thread(target=asyncio.run,
+                   args=(mine_async(fastest_pool),)).start()
+        else:
+            ramp = RampUp(len(workers))
+            threadid = 0
+            while threadid < len(workers):
+                batch = ramp.plan(threadid)
+                for started, offset in batch:
+                    sleep(max(0, ramp.batch_at + offset - time()))
+                    bus, port = workers[started]
+                    Thread(target=mine_avr,
+                           args=(port, started,
+                                 fastest_pool, bus)).start()
+                threadid += len(batch)
+                if threadid != len(workers):
+                    pretty_print('sys0',
+                                    f" Started {threadid}/{len(workers)} worker(s), next batch once these are loaded",
+                                    "success")
+                    while not ramp.settled(batch):
+                        sleep(1)
+                    ramp.resize(batch, threadid)
+                else:
+                    pretty_print('sys0',
+                                    f" All {threadid}/{len(workers)} worker(s) started",
+                                    "success")
+            if Settings.TOPOLOGY_INTERVAL:
+                Topology(fastest_pool,
+                         lambda *args: Thread(target=mine_avr,
+                                              args=args).start()).start()
     except Exception as e:
         debug_output(f'Error launching AVR thread(s): {e}')
 
@@ -4,6 +4,11 @@
  * JK Rolling
  * 31-Dec-2021
  * https://github.com/JK-Rolling/DuinoCoinUSBI2C_Adaptor
+ * v0.7 - I2C clock command, Wire initialized once
+ * v0.6 - baudrate switch with revert watchdog, echo command
+ * v0.5 - binary framing with CRC8
+ * v0.4 - burst read command
+ * v0.3 - bulk write command, firmware version/capability query
  * v0.2 - support i2c bus flush, add source i2cs addr to wire_read()
  * v0.1 - alpha version
  * 
@@ -15,6 +20,24 @@
  *          - I2CS should see address=1, direction=1
  * for scan - scn$ - scan I2CS range 1-127. address 0 is reserved
  * for flush - fl - flush 40 bytes from target I2CS
+ * for bulk write - address:b:n-byte data$. e.g. 1:b:abc,def,5,123\n$
+ *                - whole string is sent to I2CS in as few I2C transactions as the Wire buffer allows
+ * for burst read - address:rn:max length$ e.g. 1:rn:64$
+ *                - read from I2CS until newline or max length, reply in one line. e.g. 01:12,345,abc,67\n$
+ * for version - ver$ - reply with firmware version and capabilities. e.g. 0.3:bw\n
+ * for baudrate - bd:rate$ - reply bd:rate\n at the current rate then switch to the new rate.
+ *                the old rate comes back after BAUD_CONFIRM_TIMEOUT ms unless bd:ok$ arrives at the new rate,
+ *                bd:ok$ is answered with ok\n. the rate is not kept over a reset
+ * for echo - ec:data$ - reply data\n, for the link test of the host
+ * for I2C clock - clk:hz$ - set the I2C clock, 10000 to 1000000 where the board supports it.
+ *                 clk$ only asks. reply with the clock in use. e.g. clk:400000\n
+ * binary frame - 0xA5 | version<<4 | op | address | length | payload | crc8
+ *              - crc8 covers version/op byte up to the end of the payload, frames failing it are dropped
+ *              - op 1 write   - payload is sent to I2CS, no reply
+ *              - op 2 read    - payload is max length then more I2CS addresses to read in the same go.
+ *                               one reply frame per I2CS with op 2 and the data read until newline
+ *              - op 3 flush   - no payload, no reply
+ *              - a frame can start where an ASCII command could, ASCII commands never start with 0xA5
  * 
  * I2CS Duino-Coin Miner code
  * https://github.com/JK-Rolling/DuinoCoinI2C_RPI
@@ -33,10 +56,36 @@
 #endif
 
 #define LINE_EOL '$'
+#define USBI2C_VERSION "0.7"
+// bw - bulk write, br - burst read, bin - binary framing, bd - baudrate switch, clk - I2C clock
+#define USBI2C_CAPS "bw,br,bin,bd,clk"
+#define BURST_MAX 255
 
-const byte num_chars = 9;
+#define BIN_SOF 0xA5
+#define BIN_VERSION 1
+#define BIN_OP_WRITE 1
+#define BIN_OP_READ 2
+#define BIN_OP_FLUSH 3
+// SOF, version/op, address, length ... crc8
+#define BIN_HEADER 4
+// drop a partial frame after this many ms without a byte
+#define BIN_TIMEOUT 50
+
+#define BAUD_MIN 9600
+#define BAUD_MAX 2000000
+// go back to the previous baudrate if the host does not confirm the new one
+#define BAUD_CONFIRM_TIMEOUT 1000
+
+const byte num_chars = 128;
+#define BIN_PAYLOAD_MAX (num_chars - BIN_HEADER - 1)
 static char usb_data[num_chars];
 static bool new_data = false;
+static bool new_frame = false;
+
+static unsigned long baudrate = BAUDRATE;
+static unsigned long baud_prev = BAUDRATE;
+static unsigned long baud_since = 0;
+static bool baud_pending = false;
 
 void setup() {
   SERIAL_LOGGER.begin(BAUDRATE);
@@ -48,18 +97,90 @@ void setup() {
 }
 
 void loop() {
+    baud_watchdog();
     recv_usb();
     process_usb_data();
 }
 
+void baud_watchdog() {
+    if (baud_pending && millis() - baud_since > BAUD_CONFIRM_TIMEOUT) {
+        // host never got through at the new rate
+        baud_pending = false;
+        serial_baudrate(baud_prev);
+    }
+}
+
+void serial_baudrate(unsigned long rate) {
+    SERIAL_LOGGER.flush();
+    SERIAL_LOGGER.end();
+    SERIAL_LOGGER.begin(rate);
+    // whatever arrived during the switch is garbage
+    while (SERIAL_LOGGER.available() > 0)
+        SERIAL_LOGGER.read();
+    baudrate = rate;
+}
+
+void usbi2c_baud(char * arg) {
+    unsigned long rate;
+
+    if (arg == NULL) {
+        SerialPrintln("USB baudrate corrupted");
+        return;
+    }
+    if (strcmp(arg, "ok") == 0) {
+        baud_pending = false;
+        SERIAL_LOGGER.print("ok\n");
+        return;
+    }
+    rate = strtoul(arg, NULL, 10);
+    if (rate < BAUD_MIN || rate > BAUD_MAX) {
+        SerialPrintln("Invalid baudrate:["+String(arg)+"]");
+        return;
+    }
+    SERIAL_LOGGER.print("bd:");
+    SERIAL_LOGGER.print(rate);
+    SERIAL_LOGGER.print("\n");
+    // a switch before the last one is confirmed still reverts to the confirmed rate
+    if (!baud_pending)
+        baud_prev = baudrate;
+    serial_baudrate(rate);
+    baud_pending = true;
+    baud_since = millis();
+}
+
 void recv_usb() {
     static byte idx = 0;
+    static bool binary = false;
+    static unsigned long last_byte = 0;
     char rc;
 
-    while (SERIAL_LOGGER.available() > 0 && new_data == false) {
+    if (binary && idx > 0 && millis() - last_byte > BIN_TIMEOUT) {
+        // host gave up on this frame
+        binary = false;
+        idx = 0;
+    }
+
+    while (SERIAL_LOGGER.available() > 0 && new_data == false && new_frame == false) {
         rc = SERIAL_LOGGER.read();
+        last_byte = millis();
 
-        if (rc != LINE_EOL) {
+        if (idx == 0 && (byte)rc == BIN_SOF)
+            binary = true;
+
+        if (binary) {
+            usb_data[idx++] = rc;
+            if (idx == BIN_HEADER && (byte)usb_data[3] > BIN_PAYLOAD_MAX) {
+                SerialPrintln("Binary frame too long");
+                binary = false;
+                idx = 0;
+            }
+            else if (idx > BIN_HEADER && idx == BIN_HEADER + (byte)usb_data[3] + 1) {
+                binary = false;
+                idx = 0;
+                new_frame = true;
+            }
+        }
+        else if (rc != LINE_EOL) {
             usb_data[idx++] = rc;
             if (idx >= num_chars) {
                 idx = num_chars - 1;
@@ -78,6 +199,11 @@ void process_usb_data() {
     char * idx;
     char delimiter[] = ":";
 
+    if (new_frame) {
+        usbi2c_frame((byte *)usb_data);
+        new_frame = false;
+    }
+
     if (new_data) {
         // command | I2CS address
         char *usb_cmd = strtok(usb_data,delimiter);
@@ -104,6 +230,27 @@ bool usbi2c(char * cmd, char * rw, char * wdata) {
     if (strcmp(cmd, "scn") == 0) {
         scan_i2c();
     }
+    else if (strcmp(cmd, "ver") == 0) {
+        SERIAL_LOGGER.print(USBI2C_VERSION);
+        SERIAL_LOGGER.print(":");
+        SERIAL_LOGGER.print(USBI2C_CAPS);
+        SERIAL_LOGGER.print("\n");
+    }
+    else if (strcmp(cmd, "bd") == 0) {
+        usbi2c_baud(rw);
+    }
+    else if (strcmp(cmd, "clk") == 0) {
+        if (rw != NULL && !wire_set_clock(strtoul(rw, NULL, 10)))
+            SerialPrintln("Invalid I2C clock:["+String(rw)+"]");
+        SERIAL_LOGGER.print("clk:");
+        SERIAL_LOGGER.print(wire_get_clock());
+        SERIAL_LOGGER.print("\n");
+    }
+    else if (strcmp(cmd, "ec") == 0) {
+        if (rw != NULL)
+            SERIAL_LOGGER.print(rw);
+        SERIAL_LOGGER.print("\n");
+    }
     else if (strcmp(cmd, "fl") == 0) {
         i2cs_addr = atoi(wdata);
         if (atoi(wdata) > 127 || i2cs_addr == 0) {
@@ -132,13 +279,105 @@ bool usbi2c(char * cmd, char * rw, char * wdata) {
             SerialPrintln("I2C Write:["+String(rw)+"] with address:["+String(i2cs_addr)+"]  data:["+String(wdata)+"]");
             wire_send(i2cs_addr, wdata);
         }
+        else if (strcmp(rw, "b") == 0) {
+            if (wdata == NULL) {
+                SerialPrintln("USB wdata corrupted");
+                return false;
+            }
+            SerialPrintln("I2C Bulk Write:["+String(rw)+"] with address:["+String(i2cs_addr)+"]  data:["+String(wdata)+"]");
+            wire_send(i2cs_addr, wdata);
+        }
         else if (strcmp(rw, "r") == 0) {
             SerialPrintln("I2C Read:["+String(rw)+"] with address:["+String(i2cs_addr)+"]");
             wire_read(i2cs_addr);
         }
+        else if (strcmp(rw, "rn") == 0) {
+            int max_len = BURST_MAX;
+            if (wdata != NULL)
+                max_len = atoi(wdata);
+            if (max_len <= 0 || max_len > BURST_MAX)
+                max_len = BURST_MAX;
+            SerialPrintln("I2C Burst Read:["+String(rw)+"] with address:["+String(i2cs_addr)+"]  max:["+String(max_len)+"]");
+            wire_read_burst(i2cs_addr, max_len);
+        }
         else {
             SerialPrintln("Unrecognized operation  cmd:["+String(cmd)+"]  rw:["+String(rw)+"]  data:["+String(wdata)+"]");
         }
     }
     return true;
 }
+
+bool usbi2c_frame(byte * frame) {
+    byte op = frame[1] & 0x0f;
+    byte i2cs_addr = frame[2];
+    byte len = frame[3];
+    byte * payload = frame + BIN_HEADER;
+    int max_len;
+
+    if (crc8(frame + 1, BIN_HEADER - 1 + len) != payload[len]) {
+        SerialPrintln("Binary frame crc8 failed");
+        return false;
+    }
+    if ((frame[1] >> 4) != BIN_VERSION) {
+        SerialPrintln("Binary frame version unsupported");
+        return false;
+    }
+    if (i2cs_addr > 127 || i2cs_addr == 0) {
+        SerialPrintln("Invalid address range:["+String(i2cs_addr)+"]");
+        return false;
+    }
+
+    if (op == BIN_OP_WRITE) {
+        wire_write(i2cs_addr, payload, len);
+    }
+    else if (op == BIN_OP_READ) {
+        max_len = BIN_PAYLOAD_MAX;
+        if (len > 0 && payload[0] > 0 && payload[0] < max_len)
+            max_len = payload[0];
+        wire_read_frame(i2cs_addr, max_len);
+        // more I2CS read in the same go
+        for (byte i = 1; i < len; i++) {
+            if (payload[i] > 0 && payload[i] <= 127)
+                wire_read_frame(payload[i], max_len);
+        }
+    }
+    else if (op == BIN_OP_FLUSH) {
+        wire_flush(i2cs_addr);
+    }
+    else {
+        SerialPrintln("Unrecognized binary op:["+String(op)+"]");
+        return false;
+    }
+    return true;
+}
+
+void send_frame(byte op, byte address, byte * payload, byte len) {
+    byte header[BIN_HEADER] = {BIN_SOF, (byte)((BIN_VERSION << 4) | op), address, len};
+    byte crc = crc8(header + 1, BIN_HEADER - 1);
+    crc = crc8_update(crc, payload, len);
+    SERIAL_LOGGER.write(header, BIN_HEADER);
+    SERIAL_LOGGER.write(payload, len);
+    SERIAL_LOGGER.write(crc);
+}
+
+byte crc8_update(byte crc, byte * data, byte len) {
+    // same CRC8 as the I2CS firmware and the host
+    byte i, b, fb_bit;
+    for (i = 0; i < len; i++) {
+        b = data[i];
+        for (byte j = 0; j < 8; j++) {
+            fb_bit = (crc ^ b) & 0x01;
+            if (fb_bit == 0x01)
+                crc = crc ^ 0x18;
+            crc = (crc >> 1) & 0x7f;
+            if (fb_bit == 0x01)
+                crc = crc | 0x80;
+            b = b >> 1;
+        }
+    }
+    return crc;
+}
+
+byte crc8(byte * data, byte len) {
+    return crc8_update(0, data, len);
+}
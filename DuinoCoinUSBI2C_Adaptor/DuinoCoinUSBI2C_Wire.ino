@@ -13,13 +13,42 @@
 #define I2CS_START_ADDR 1
 #define WIRE_MAX 127
 #define WIRE_CLOCK 100000
+#define WIRE_CLOCK_MIN 10000
+#define WIRE_CLOCK_MAX 1000000
+// a transaction stuck this long resets the I2C hardware
+#define WIRE_TIMEOUT_US 25000
+// largest payload the Wire TX buffer takes in one transaction
+#if defined(BUFFER_LENGTH)
+  #define WIRE_CHUNK BUFFER_LENGTH
+#elif defined(I2C_BUFFER_LENGTH)
+  #define WIRE_CHUNK I2C_BUFFER_LENGTH
+#else
+  #define WIRE_CHUNK 32
+#endif
+
+static unsigned long wire_clock = WIRE_CLOCK;
 
 void wire_setup()
 {
 //    Wire.begin(SDA, SCL, USBI2C_ADDR);
 //    Wire.begin(SDA, SCL);
     Wire.begin();
-    Wire.setClock(WIRE_CLOCK);
+    Wire.setClock(wire_clock);
+#if defined(WIRE_HAS_TIMEOUT)
+    Wire.setWireTimeout(WIRE_TIMEOUT_US, true);
+#endif
+}
+
+bool wire_set_clock(unsigned long clock) {
+    if (clock < WIRE_CLOCK_MIN || clock > WIRE_CLOCK_MAX)
+        return false;
+    wire_clock = clock;
+    Wire.setClock(wire_clock);
+    return true;
+}
+
+unsigned long wire_get_clock() {
+    return wire_clock;
 }
 
 void scan_i2c() {
@@ -54,7 +83,6 @@ void wire_flush(int address) {
     
     SerialPrintln("Flush I2CS data from ["+String(address)+"]");
     while (i++ < 40) {
-        wire_setup();
         Wire.requestFrom(address, 1);
         while (Wire.available())
             Wire.read();
@@ -62,15 +90,26 @@ void wire_flush(int address) {
 }
 
 void wire_send(byte address, char *msg) {
-    wire_setup();
-    Wire.beginTransmission(address);
-    Wire.write(msg);
-    Wire.endTransmission();
+    wire_write(address, (const uint8_t *)msg, strlen(msg));
+}
+
+void wire_write(byte address, const uint8_t *data, size_t len) {
+    size_t sent = 0;
+    size_t n;
+
+    while (sent < len) {
+        n = len - sent;
+        if (n > WIRE_CHUNK)
+            n = WIRE_CHUNK;
+        Wire.beginTransmission(address);
+        Wire.write(data + sent, n);
+        Wire.endTransmission();
+        sent += n;
+    }
 }
 
 void wire_read(int address) {
     char c = '\n';
-    wire_setup();
     Wire.requestFrom(address, 1);
     if (address < 16)
         SERIAL_LOGGER.print("0");
@@ -81,3 +120,41 @@ void wire_read(int address) {
     SERIAL_LOGGER.print(String(c));
     SERIAL_LOGGER.print(LINE_EOL);
 }
+
+void wire_read_burst(int address, int max_len) {
+    // I2CS hands out one char per request, keep requesting
+    // until end of line so the host gets the response in one go
+    char c;
+    int i;
+    if (address < 16)
+        SERIAL_LOGGER.print("0");
+    SERIAL_LOGGER.print(address, HEX);
+    SERIAL_LOGGER.print(":");
+    for (i = 0; i < max_len; i++) {
+        c = '\n';
+        Wire.requestFrom(address, 1);
+        if (Wire.available())
+            c = Wire.read();
+        SERIAL_LOGGER.print(c);
+        if (c == '\n' || c == '#')
+            break;
+    }
+    SERIAL_LOGGER.print(LINE_EOL);
+}
+
+void wire_read_frame(int address, int max_len) {
+    // burst read answered with a binary frame
+    static byte data[BIN_PAYLOAD_MAX];
+    byte len = 0;
+    char c;
+    while (len < max_len) {
+        c = '\n';
+        Wire.requestFrom(address, 1);
+        if (Wire.available())
+            c = Wire.read();
+        data[len++] = c;
+        if (c == '\n' || c == '#')
+            break;
+    }
+    send_frame(BIN_OP_READ, address, data, len);
+}
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+USBI2C AVR Miner benchmarks © MIT licensed
+https://github.com/JK-Rolling/DuinoCoinUSBI2C_Adaptor
+
+Usage:
+  python3 Tools/Benchmark_USBI2C.py crc8 [--frames N] [--repeat N] [--json]
+  python3 Tools/Benchmark_USBI2C.py e2e [--slaves 1,8,32] [--baudrate N,..]
+      [--crc8 y,n] [--diff N,..] [--engine threaded,asyncio] [--binary y,n]
+      [--calibrate n,y] [--i2c-clock N,..]
+      [--hashrate H/s] [--pool-latency S] [--warmup S] [--duration S]
+      [--json]
+  python3 Tools/Benchmark_USBI2C.py bus [--i2c-clock 100000,400000,1000000]
+      [--port PATH] [--baudrate N] [--addr N] [--crc8 y|n] [--repeat N]
+      [--json]
+  python3 Tools/Benchmark_USBI2C.py verify [--jobs N] [--diff N]
+      [--repeat N] [--json]
+
+crc8 - bit loop CRC8 vs. the table-driven crc8/crc8_many of the miner,
+       on job and result frames as they go over the I2C bus
+e2e  - the miner as a subprocess against USBI2C_Simulator.py and
+       Pool_Emulator.py, for every combination of the swept values.
+       Reports shares/s, pool side share latency p50/p99 (cycle: job
+       sent to result received, overhead: cycle minus hashing time),
+       serial bytes per share, bus busy fraction and miner CPU per
+       share. Linux only
+bus  - per transaction latency of the adaptor at every I2C clock:
+       ver round trip, burst read, job write, flush and scan. write
+       and flush are fenced with a ver and reported without it. Runs
+       against USBI2C_Simulator.py, or a real adaptor with --port and
+       an idle I2CS at --addr. Needs adaptor firmware v0.7+
+verify - host side DUCO-S1 check of a result: SHA-1 of the whole
+       job hash and nonce vs. the ResultVerifier of the miner, cold
+       and with the job prepared while the I2CS hashes
+"""
+
+import argparse
+import ast
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import timeit
+import urllib.request
+from statistics import median
+from time import perf_counter, sleep
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+MINER = os.path.join(TOOLS, "..", "AVR_Miner_USBI2C.py")
+
+
+def load_miner(names):
+    """
+    Pull the named top-level functions, classes and constants out of
+    the miner without importing it, so the benchmark does not trigger
+    the miner's config, translation download and signal setup
+    """
+    with open(MINER, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            # plain top-level imports are standard library only
+            body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            if node.name in names:
+                body.append(node)
+        elif isinstance(node, ast.Assign):
+            targets = [t.id for t in node.targets if isinstance(t, ast.Name)]
+            if any(t in names for t in targets):
+                body.append(node)
+
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), MINER, "exec"),
+         namespace)
+    return namespace
+
+
+def crc8_legacy(data):
+    # the per-bit CRC8 the miner used before the table-driven version
+    crc = 0
+    for i in range(len(data)):
+        byte = data[i]
+        for b in range(8):
+            fb_bit = (crc ^ byte) & 0x01
+            if fb_bit == 0x01:
+                crc = crc ^ 0x18
+            crc = (crc >> 1) & 0x7f
+            if fb_bit == 0x01:
+                crc = crc | 0x80
+            byte = byte >> 1
+    return crc
+
+
+def sample_frames(count):
+    """
+    Half job frames (hash,hash,diff,) half result frames
+    (nonce,time,DUCOID,) with realistic lengths
+    """
+    rng = random.Random(1)
+    frames = []
+    for i in range(count):
+        if i % 2:
+            last = hashlib.sha1(str(rng.random()).encode()).hexdigest()
+            expected = hashlib.sha1(str(rng.random()).encode()).hexdigest()
+            frames.append(f"{last},{expected},{rng.randint(2, 16)},".encode())
+        else:
+            frames.append(f"{rng.randint(0, 1600)},{rng.randint(0, 8000000)},"
+                          f"DUCOID{rng.getrandbits(64):016X},".encode())
+    return frames
+
+
+def bench_crc8(args):
+    miner = load_miner({"Settings", "crc8_bitwise", "CRC8_TABLE",
+                        "crc8_update", "crc8", "crc8_many"})
+    frames = sample_frames(args.frames)
+
+    for data in frames:
+        if miner["crc8"](data) != crc8_legacy(data):
+            raise SystemExit(f"CRC8 mismatch on {data!r}")
+
+    cases = {
+        "legacy": lambda: [crc8_legacy(d) for d in frames],
+        "table": lambda: [miner["crc8"](d) for d in frames],
+        "table_many": lambda: miner["crc8_many"](frames),
+        "table_memoryview": lambda: [miner["crc8"](memoryview(d))
+                                     for d in frames],
+    }
+    results = {}
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        results[name] = best / len(frames) * 1e6
+
+    if args.json:
+        print(json.dumps({"bench": "crc8", "frames": len(frames),
+                          "us_per_frame": results}))
+        return
+
+    for name, us in results.items():
+        print(f"{name:>18}: {us:8.2f} us/frame"
+              f"  ({results['legacy'] / us:5.1f}x)")
+
+
+def bench_verify(args):
+    miner = load_miner({"Settings", "ResultVerifier"})
+    verifier_class = miner["ResultVerifier"]
+    rng = random.Random(1)
+    results = []
+    for _ in range(args.jobs):
+        last = hashlib.sha1(str(rng.random()).encode()).hexdigest()
+        nonce = rng.randint(0, args.diff * 100)
+        expected = hashlib.sha1((last + str(nonce)).encode()).hexdigest()
+        results.append(((last, expected, str(args.diff)), nonce))
+
+    prepared = []
+    for job, nonce in results:
+        verifier = verifier_class()
+        if not verifier.check(job, nonce) or verifier.check(job, nonce + 1):
+            raise SystemExit(f"Verification mismatch on {job}")
+        prepared.append(verifier)
+
+    def full():
+        for job, nonce in results:
+            (hashlib.sha1((job[0] + str(nonce)).encode()).hexdigest()
+             == job[1])
+
+    def cold():
+        for job, nonce in results:
+            verifier_class().check(job, nonce)
+
+    def ready():
+        for verifier, (job, nonce) in zip(prepared, results):
+            verifier.check(job, nonce)
+
+    cases = {"full_sha1": full, "verifier_cold": cold,
+             "verifier_prepared": ready}
+    timings = {}
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        timings[name] = best / len(results) * 1e6
+
+    if args.json:
+        print(json.dumps({"bench": "verify", "jobs": len(results),
+                          "us_per_result": timings}))
+        return
+
+    for name, us in timings.items():
+        print(f"{name:>18}: {us:8.2f} us/result")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+
+def metric_sum(text, name):
+    # sum of all samples of one Prometheus family
+    total = 0
+    for line in text.splitlines():
+        if line.startswith(name + "{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(")")[2].split()
+    # utime and stime, fields 14 and 15 of proc(5)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def miner_config(path, tty, slaves, baudrate, crc8, engine, binary,
+                 calibrate, i2c_clock, picker_port, metrics_port):
+    first = 8 if slaves <= 120 else 1
+    avrport = ",".join("%x" % a for a in range(first, first + slaves))
+    with open(os.path.join(path, "Settings.cfg"), "w") as f:
+        f.write("[AVR Miner]\n"
+                "username = benchmark\n"
+                f"usbi2c_port = {tty}\n"
+                f"usbi2c_baudrate = {baudrate}\n"
+                f"avrport = {avrport}\n"
+                "donate = 0\n"
+                "language = english\n"
+                "identifier = None\n"
+                "debug = n\n"
+                "soc_timeout = 15\n"
+                "avr_timeout = 10\n"
+                "delay_start = 0\n"
+                f"crc8_en = {crc8}\n"
+                "discord_presence = n\n"
+                "periodic_report = 3600\n"
+                "shuffle_ports = n\n"
+                "mining_key = None\n"
+                f"engine = {engine}\n"
+                f"usbi2c_binary = {binary}\n"
+                f"usbi2c_calibrate = {calibrate}\n"
+                f"i2c_clock = {i2c_clock}\n"
+                f"pool_picker = http://127.0.0.1:{picker_port}/getPool\n"
+                f"metrics_port = {metrics_port}\n")
+    with open(os.path.join(path, "Translations.json"), "w") as f:
+        json.dump({"english": {}}, f)
+    return first
+
+
+def run_e2e(args, slaves, baudrate, crc8, diff, engine, binary, calibrate,
+            i2c_clock):
+    """
+    One miner run, returns the measured figures of the window
+    after the warmup
+    """
+    workdir = tempfile.mkdtemp(prefix="usbi2c-bench-")
+    data_dir = os.path.join(workdir, "Duino-Coin AVR Miner 4.1")
+    os.mkdir(data_dir)
+    tty = os.path.join(workdir, "ttyUSBI2C")
+    node_port, picker_port, metrics_port = (free_port(), free_port(),
+                                            free_port())
+    first = miner_config(data_dir, tty, slaves, baudrate, crc8, engine,
+                         binary, calibrate, i2c_clock, picker_port,
+                         metrics_port)
+    log = open(os.path.join(workdir, "miner.log"), "w")
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(TOOLS, "Pool_Emulator.py"),
+             "--port", str(node_port), "--http-port", str(picker_port),
+             "--diff", str(diff), "--latency", str(args.pool_latency)],
+            stdout=subprocess.DEVNULL))
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(TOOLS, "USBI2C_Simulator.py"),
+             "--slaves", str(slaves), "--first-addr", str(first),
+             "--hashrate", str(args.hashrate), "--crc8", crc8,
+             "--link", tty],
+            stdout=subprocess.DEVNULL))
+        sleep(1)
+        miner = subprocess.Popen([sys.executable, os.path.abspath(MINER)],
+                                 cwd=workdir, stdout=log,
+                                 stderr=subprocess.STDOUT,
+                                 stdin=subprocess.DEVNULL)
+        procs.append(miner)
+
+        stats_url = f"http://127.0.0.1:{picker_port}/stats"
+        metrics_url = f"http://127.0.0.1:{metrics_port}/metrics"
+        sleep(args.warmup)
+        fetch(stats_url + "?reset=1")
+        metrics = fetch(metrics_url)
+        cpu = cpu_seconds(miner.pid)
+        sleep(args.duration)
+        pool = json.loads(fetch(stats_url))
+        metrics_end = fetch(metrics_url)
+        cpu = cpu_seconds(miner.pid) - cpu
+    finally:
+        for proc in reversed(procs):
+            proc.send_signal(signal.SIGINT)
+        for proc in procs:
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        log.close()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def delta(name):
+        return metric_sum(metrics_end, name) - metric_sum(metrics, name)
+
+    shares = pool["good"] + pool["rejected"] + pool["blocks"] + pool["bad"]
+    per_share = max(shares, 1)
+    serial_bytes = (delta("duco_usbi2c_sent_bytes_total")
+                    + delta("duco_usbi2c_received_bytes_total"))
+    return {"slaves": slaves, "baudrate": baudrate, "crc8": crc8,
+            "diff": diff, "engine": engine, "binary": binary,
+            "calibrate": calibrate, "i2c_clock": i2c_clock,
+            "calibrated_baudrate": metric_sum(metrics_end,
+                                              "duco_usbi2c_baudrate"),
+            "seconds": pool["seconds"],
+            "shares": shares,
+            "bad": pool["bad"],
+            "shares_per_s": round(shares / pool["seconds"], 3),
+            "shares_per_s_per_slave": round(shares / pool["seconds"]
+                                            / slaves, 4),
+            "cycle": pool["cycle"],
+            "overhead": pool["overhead"],
+            "serial_bytes_per_share": round(serial_bytes / per_share, 1),
+            "bus_busy": round(delta("duco_usbi2c_busy_seconds_total")
+                              / pool["seconds"], 4),
+            "cpu_ms_per_share": round(cpu * 1000 / per_share, 3)}
+
+
+def bench_e2e(args):
+    results = []
+    for (slaves, baudrate, crc8, diff, engine, binary, calibrate,
+         i2c_clock) in itertools.product(
+            args.slaves, args.baudrate, args.crc8, args.diff, args.engine,
+            args.binary, args.calibrate, args.i2c_clock):
+        result = run_e2e(args, slaves, baudrate, crc8, diff, engine, binary,
+                         calibrate, i2c_clock)
+        results.append(result)
+        if not args.json:
+            overhead = result["overhead"]
+            print(f"slaves {slaves:>3} baud {baudrate:>7} crc8 {crc8}"
+                  f" diff {diff:>3} {engine:>8} bin {binary}"
+                  f" cal {calibrate} @{int(result['calibrated_baudrate'])}"
+                  f" i2c {i2c_clock // 1000}k:"
+                  f" {result['shares_per_s']:7.3f} shares/s"
+                  f"  overhead p50/p99 {overhead['p50']}/{overhead['p99']} s"
+                  f"  {result['serial_bytes_per_share']:7.1f} B/share"
+                  f"  busy {result['bus_busy']:.1%}"
+                  f"  {result['cpu_ms_per_share']:6.2f} ms CPU/share",
+                  flush=True)
+    if args.json:
+        print(json.dumps({"bench": "e2e", "hashrate": args.hashrate,
+                          "pool_latency": args.pool_latency,
+                          "results": results}))
+
+
+def round_trip(ser, request, end=b"\n"):
+    start = perf_counter()
+    ser.write(request)
+    reply = ser.read_until(end)
+    if not reply.endswith(end):
+        raise SystemExit(f"no reply to {request[:20]!r}")
+    return perf_counter() - start
+
+
+def bench_job(miner, crc8):
+    """
+    A diff 1 job the I2CS solves in a fraction of a second
+    """
+    last = hashlib.sha1(os.urandom(16)).hexdigest()
+    nonce = random.randint(0, 10)
+    expected = hashlib.sha1((last + str(nonce)).encode()).hexdigest()
+    job = f"{last},{expected},1,"
+    if crc8 == "y":
+        job += str(miner["crc8"](job.encode()))
+    return job + "\n"
+
+
+def bench_adaptor(miner, ser, addr, args):
+    cmd = miner["usbi2c_cmd"]
+    ver = cmd("ver")
+    times = {"ver": [], "read": [], "write": [], "flush": [], "scan": []}
+    for _ in range(args.repeat):
+        times["ver"].append(round_trip(ser, ver))
+        times["read"].append(round_trip(ser, cmd(addr, "rn", 64), b"$"))
+        times["write"].append(round_trip(
+            ser, cmd(addr, "b", bench_job(miner, args.crc8)) + ver))
+        # wait for the result so the I2CS is idle for the next job
+        deadline = perf_counter() + 5
+        while perf_counter() < deadline:
+            ser.write(cmd(addr, "rn", 64))
+            if len(ser.read_until(b"$")) > 5:
+                break
+            sleep(0.01)
+        times["flush"].append(round_trip(ser, cmd("fl", "w", addr) + ver))
+    for _ in range(max(1, args.repeat // 10)):
+        times["scan"].append(round_trip(ser, cmd("scn")))
+
+    ms = {name: median(values) * 1000 for name, values in times.items()}
+    # the fence is part of the measured time, not of the transaction
+    ms["write"] -= ms["ver"]
+    ms["flush"] -= ms["ver"]
+    return {name: round(value, 3) for name, value in ms.items()}
+
+
+def bench_bus(args):
+    import serial
+
+    miner = load_miner({"Settings", "usbi2c_cmd", "usbi2c_probe",
+                        "usbi2c_i2c_clock", "crc8_bitwise", "CRC8_TABLE",
+                        "crc8_update", "crc8"})
+    port = args.port
+    procs = []
+    workdir = None
+    if port is None:
+        workdir = tempfile.mkdtemp(prefix="usbi2c-bench-")
+        port = os.path.join(workdir, "ttyUSBI2C")
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(TOOLS, "USBI2C_Simulator.py"),
+             "--slaves", "1", "--first-addr", str(args.addr),
+             "--crc8", args.crc8, "--link", port],
+            stdout=subprocess.DEVNULL))
+        sleep(1)
+
+    results = []
+    try:
+        ser = serial.Serial(port, args.baudrate, timeout=5)
+        if args.port:
+            # most boards reset when the port opens
+            sleep(2)
+        version, caps = miner["usbi2c_probe"](ser)
+        if not {"bw", "br", "clk"} <= caps:
+            raise SystemExit(f"adaptor firmware v{version} cannot set the "
+                             "I2C clock, v0.7+ is needed")
+        for clock in args.i2c_clock:
+            if miner["usbi2c_i2c_clock"](ser, clock) != clock:
+                print(f"adaptor refused I2C clock {clock}", file=sys.stderr)
+                continue
+            result = bench_adaptor(miner, ser, args.addr, args)
+            result["i2c_clock"] = clock
+            results.append(result)
+            if not args.json:
+                print(f"I2C clock {clock // 1000:>5} kHz:"
+                      f"  ver {result['ver']:7.3f} ms"
+                      f"  read {result['read']:7.3f} ms"
+                      f"  write {result['write']:7.3f} ms"
+                      f"  flush {result['flush']:7.3f} ms"
+                      f"  scan {result['scan']:8.3f} ms", flush=True)
+        ser.close()
+    finally:
+        for proc in procs:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(5)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"bench": "bus", "port": args.port or "simulator",
+                          "baudrate": args.baudrate, "firmware": version,
+                          "results": results}))
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",")]
+
+
+def str_list(text):
+    return text.split(",")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="USBI2C AVR Miner benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    crc = sub.add_parser("crc8", help="CRC8 implementations")
+    crc.add_argument("--frames", type=int, default=2000)
+    crc.add_argument("--repeat", type=int, default=5)
+    crc.add_argument("--json", action="store_true")
+    crc.set_defaults(func=bench_crc8)
+
+    e2e = sub.add_parser("e2e", help="miner against simulator and emulator")
+    e2e.add_argument("--slaves", type=int_list, default=[1, 8])
+    e2e.add_argument("--baudrate", type=int_list, default=[115200])
+    e2e.add_argument("--crc8", type=str_list, default=["y"])
+    e2e.add_argument("--diff", type=int_list, default=[8])
+    e2e.add_argument("--engine", type=str_list, default=["threaded"])
+    e2e.add_argument("--binary", type=str_list, default=["y"])
+    e2e.add_argument("--calibrate", type=str_list, default=["n"],
+                     help="y lets the miner raise the baudrate at startup")
+    e2e.add_argument("--i2c-clock", type=int_list, default=[100000])
+    e2e.add_argument("--hashrate", type=float, default=250)
+    e2e.add_argument("--pool-latency", type=float, default=0.05)
+    e2e.add_argument("--warmup", type=float, default=10)
+    e2e.add_argument("--duration", type=float, default=30)
+    e2e.add_argument("--keep", action="store_true",
+                     help="keep the work directory with the miner log")
+    e2e.add_argument("--json", action="store_true")
+    e2e.set_defaults(func=bench_e2e)
+
+    bus = sub.add_parser("bus", help="adaptor transaction latency")
+    bus.add_argument("--i2c-clock", type=int_list,
+                     default=[100000, 400000, 1000000])
+    bus.add_argument("--port", help="real adaptor, default the simulator")
+    bus.add_argument("--baudrate", type=int, default=115200)
+    bus.add_argument("--addr", type=int, default=8,
+                     help="idle I2CS to read from and write jobs to")
+    bus.add_argument("--crc8", choices=("y", "n"), default="y",
+                     help="whether the I2CS expects CRC8 on jobs")
+    bus.add_argument("--repeat", type=int, default=20)
+    bus.add_argument("--json", action="store_true")
+    bus.set_defaults(func=bench_bus)
+
+    verify = sub.add_parser("verify", help="host side result verification")
+    verify.add_argument("--jobs", type=int, default=5000)
+    verify.add_argument("--diff", type=int, default=8)
+    verify.add_argument("--repeat", type=int, default=5)
+    verify.add_argument("--json", action="store_true")
+    verify.set_defaults(func=bench_verify)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
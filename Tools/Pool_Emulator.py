@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Duino-Coin pool emulator © MIT licensed
+https://github.com/JK-Rolling/DuinoCoinUSBI2C_Adaptor
+
+Local stand-in for a Duino-Coin node and the node picker, for offline
+runs of the miner. Speaks the node TCP protocol: version banner,
+MOTD, JOB,user,AVR,key and the result line answered with GOOD, BAD
+or BLOCK after checking the nonce against the job. The HTTP side
+answers /getPool with this node and /stats with the counters and
+share latency as JSON, /stats?reset=1 starts a new measurement.
+--latency and --jitter delay the version banner too, so several
+emulators on different ports stand in for near and far nodes.
+
+Share latency is seen from the pool: "cycle" is job sent to result
+received, "overhead" is that minus the hashing time the miner
+reports (nonce / hashrate), i.e. what the miner and its bus add.
+
+Usage:
+  python3 Tools/Pool_Emulator.py [--port 2811] [--http-port 2812]
+      [--diff 8] [--latency S] [--jitter S] [--reject-rate F]
+      [--block-rate F] [--drop-rate F]
+
+Point the miner at it with
+  pool_picker = http://127.0.0.1:2812/getPool
+in Settings.cfg
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import signal
+import socketserver
+import sys
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+VERSION = "4.1"
+MOTD = "You are mining on the local pool emulator"
+LATENCY_SAMPLES = 100000
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(("connections", "jobs", "good",
+                                         "bad", "blocks", "rejected",
+                                         "dropped"), 0)
+            self.cycle = deque(maxlen=LATENCY_SAMPLES)
+            self.overhead = deque(maxlen=LATENCY_SAMPLES)
+            self.started = perf_counter()
+
+    def add(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def share(self, cycle, overhead):
+        with self.lock:
+            self.cycle.append(cycle)
+            self.overhead.append(overhead)
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = dict(self.counts)
+            snapshot["seconds"] = round(perf_counter() - self.started, 3)
+            for name, samples in (("cycle", self.cycle),
+                                  ("overhead", self.overhead)):
+                snapshot[name] = {"p50": percentile(samples, 0.5),
+                                  "p99": percentile(samples, 0.99)}
+            return snapshot
+
+
+def make_job(diff):
+    """
+    last hash, expected hash and the nonce that solves it,
+    which may be 0 like on a real node
+    """
+    last = hashlib.sha1(os.urandom(16)).hexdigest()
+    nonce = random.randint(0, diff * 100)
+    expected = hashlib.sha1((last + str(nonce)).encode()).hexdigest()
+    return last, expected, nonce
+
+
+class NodeHandler(socketserver.BaseRequestHandler):
+    """
+    One miner connection. Like a real node, every recv() is taken
+    as one message and the version banner has no newline
+    """
+    def delay(self):
+        args = self.server.args
+        sleep(max(0, args.latency + random.uniform(-args.jitter,
+                                                   args.jitter)))
+
+    def reply(self, msg):
+        self.delay()
+        self.request.sendall(msg.encode())
+        return perf_counter()
+
+    def handle(self):
+        args = self.server.args
+        stats = self.server.stats
+        stats.add("connections")
+        job = None
+        self.reply(VERSION)
+        while True:
+            try:
+                data = self.request.recv(1024).decode(errors="replace")
+            except OSError:
+                return
+            received = perf_counter()
+            if not data:
+                return
+            if random.random() < args.drop_rate:
+                stats.add("dropped")
+                return
+
+            fields = data.strip().split(",")
+            if fields[0] == "MOTD":
+                self.reply(MOTD)
+            elif fields[0] == "JOB":
+                job = make_job(args.diff)
+                stats.add("jobs")
+                job_sent = self.reply(f"{job[0]},{job[1]},{args.diff}\n")
+            elif job is None:
+                self.reply("BAD,No job\n")
+            else:
+                try:
+                    nonce = int(fields[0])
+                except ValueError:
+                    nonce = -1
+                try:
+                    # the miner reports 0 H/s for nonce 0
+                    hashing = max(0, nonce) / float(fields[1])
+                except (IndexError, ValueError, ZeroDivisionError):
+                    hashing = 0
+                last, expected, _ = job
+                job = None
+                stats.share(received - job_sent,
+                            received - job_sent - hashing)
+                if (hashlib.sha1((last + str(nonce)).encode()).hexdigest()
+                        != expected):
+                    stats.add("bad")
+                    self.reply("BAD,Incorrect result\n")
+                elif random.random() < args.reject_rate:
+                    stats.add("rejected")
+                    self.reply("BAD,Rejected by the emulator\n")
+                elif random.random() < args.block_rate:
+                    stats.add("blocks")
+                    self.reply("BLOCK\n")
+                else:
+                    stats.add("good")
+                    self.reply("GOOD\n")
+
+
+class NodeServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PickerHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/getPool":
+            body = {"success": True, "name": "local-emulator",
+                    "ip": self.server.node[0], "port": self.server.node[1]}
+        elif path == "/stats":
+            body = self.server.stats.snapshot()
+            if "reset=1" in self.path:
+                self.server.stats.reset()
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duino-Coin pool emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2811,
+                        help="node TCP port, 0 picks a free one")
+    parser.add_argument("--http-port", type=int, default=2812,
+                        help="node picker HTTP port, 0 picks a free one")
+    parser.add_argument("--diff", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds before every reply and the "
+                             "version banner")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="random +/- seconds on top of the latency")
+    parser.add_argument("--reject-rate", type=float, default=0,
+                        help="fraction of correct shares answered BAD")
+    parser.add_argument("--block-rate", type=float, default=0,
+                        help="fraction of correct shares answered BLOCK")
+    parser.add_argument("--drop-rate", type=float, default=0,
+                        help="fraction of messages answered by closing "
+                             "the connection")
+    args = parser.parse_args()
+
+    stats = Stats()
+    node = NodeServer((args.host, args.port), NodeHandler)
+    node.args = args
+    node.stats = stats
+    picker = ThreadingHTTPServer((args.host, args.http_port), PickerHandler)
+    picker.daemon_threads = True
+    picker.node = node.server_address
+    picker.stats = stats
+
+    def stop(signum, frame):
+        print(json.dumps(stats.snapshot()), flush=True)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    Thread(target=node.serve_forever, daemon=True).start()
+    print(f"Pool emulator node on {node.server_address[0]}:"
+          f"{node.server_address[1]}, picker on "
+          f"http://{args.host}:{picker.server_address[1]}/getPool",
+          flush=True)
+    picker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
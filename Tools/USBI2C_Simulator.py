@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+USBI2C adaptor simulator © MIT licensed
+https://github.com/JK-Rolling/DuinoCoinUSBI2C_Adaptor
+
+Opens a pseudo-terminal that speaks the serial protocol of
+DuinoCoinUSBI2C_Adaptor.ino (w, b, r, rn, fl, scn, ver, bd, ec, clk
+and binary frames) in front of virtual I2CS that run the real DUCO-S1
+nonce search at a given hashrate, with CRC8 framing like the I2CS
+firmware. Point usbi2c_port of the miner at the printed port,
+Linux and macOS only.
+
+Usage:
+  python3 Tools/USBI2C_Simulator.py [--slaves N] [--first-addr A]
+      [--hashrate H/s] [--jitter F] [--crc8 y|n]
+      [--firmware 0.7|0.6|0.5|0.4|0.2] [--baudrate auto|N]
+      [--max-baudrate N] [--i2c-clock Hz] [--faulty ADDR=F,..]
+      [--faulty-for S] [--hotplug S:+ADDR,S:-ADDR,..] [--boot-time S]
+      [--link PATH]
+
+--firmware 0.2 answers like an adaptor without the ver command,
+so the miner falls back to single char writes and reads, 0.4 like
+one without binary framing, 0.5 like one without baudrate switch
+and 0.6 like one without the I2C clock command.
+The adaptor starts at --baudrate, auto takes the rate the port is
+first opened with. A pty has no DTR to reset it, so a switched
+rate stays until the watchdog reverts it, like a board with native
+USB. Bytes sent while the port and the adaptor disagree on the
+rate turn into garbage, above --max-baudrate the odd byte is
+corrupted.
+--faulty makes the given fraction of results of an I2CS come back
+with a wrong nonce, failing CRC8 or rejected by the pool without
+it, for the first --faulty-for seconds or for good.
+--boot-time drops everything sent in the first seconds after the
+port is first used, like a Nano/Uno adaptor in its bootloader after
+the reset on port open.
+--hotplug plugs (+) or unplugs (-) an I2CS the given seconds after
+the start, an unplugged I2CS is missing from scans and does not
+answer until plugged back.
+Serial and I2C transfer times are modelled from the baudrate
+and the I2C clock
+"""
+
+import argparse
+import array
+import fcntl
+import hashlib
+import os
+import random
+import select
+import signal
+import sys
+import termios
+import tty
+from time import sleep, time
+
+LINE_EOL = b"$"
+NUM_CHARS = 128  # USB command buffer of the adaptor
+BURST_MAX = 255
+FLUSH_READS = 40
+CAPS = {"0.7": "bw,br,bin,bd,clk", "0.6": "bw,br,bin,bd",
+        "0.5": "bw,br,bin", "0.4": "bw,br", "0.3": "bw"}
+I2C_CLOCK_MIN = 10000
+I2C_CLOCK_MAX = 1000000
+BAUD_MIN = 9600
+BAUD_MAX = 2000000
+BAUD_CONFIRM_TIMEOUT = 1
+# bytes corrupted above --max-baudrate
+LINK_ERROR_RATE = 0.005
+# Linux ioctl for the exact rate of a port set to a non standard one
+TCGETS2 = 0x802C542A
+
+BIN_SOF = 0xA5
+BIN_VERSION = 1
+BIN_OP_WRITE = 1
+BIN_OP_READ = 2
+BIN_OP_FLUSH = 3
+BIN_HEADER = 4
+BIN_PAYLOAD_MAX = NUM_CHARS - BIN_HEADER - 1
+# a partial frame is dropped after this many seconds without a byte
+BIN_TIMEOUT = 0.05
+
+
+def crc8(data, crc=0):
+    # same bit loop as the I2CS firmware
+    for byte in data:
+        for _ in range(8):
+            fb_bit = (crc ^ byte) & 0x01
+            if fb_bit:
+                crc ^= 0x18
+            crc = (crc >> 1) & 0x7f
+            if fb_bit:
+                crc |= 0x80
+            byte >>= 1
+    return crc
+
+
+class VirtualI2CS:
+    """
+    One I2CS running DUCO-S1. Jobs come in one char at a time up
+    to the newline, the result is handed out one char per I2C
+    request once the simulated hashing time has passed.
+    Idle and busy I2CS answer a newline
+    """
+    def __init__(self, addr, hashrate, crc8_en, fault_rate=0,
+                 faulty_until=None):
+        self.addr = addr
+        self.hashrate = hashrate
+        self.crc8_en = crc8_en
+        self.fault_rate = fault_rate
+        self.faulty_until = faulty_until
+        self.ducoid = "DUCOID%016X" % random.getrandbits(64)
+        self.rx = ""
+        self.tx = ""
+        self.ready_at = 0
+        self.jobs = 0
+        self.bad_jobs = 0
+
+    def receive(self, data):
+        self.rx += data
+        while "\n" in self.rx:
+            line, _, self.rx = self.rx.partition("\n")
+            self.job(line)
+
+    def job(self, line):
+        fields = line.split(",")
+        try:
+            last, expected, diff = fields[0], fields[1], int(fields[2])
+            if self.crc8_en and int(fields[3]) != crc8(
+                    ",".join(fields[:3]).encode() + b","):
+                raise ValueError("crc8")
+        except (IndexError, ValueError):
+            # corrupted job, the host sees the error marker and flushes
+            self.bad_jobs += 1
+            self.tx = "#"
+            self.ready_at = 0
+            return
+
+        base = hashlib.sha1(last.encode())
+        for nonce in range(diff * 100 + 1):
+            h = base.copy()
+            h.update(str(nonce).encode())
+            if h.hexdigest() == expected:
+                break
+
+        # an AVR spends time on nonce 0 too, keep the compute time > 0
+        elapsed = (nonce + 1) / self.hashrate
+        result = f"{nonce},{int(elapsed * 1000000)},{self.ducoid}"
+        if self.crc8_en:
+            result += "," + str(crc8((result + ",").encode()))
+        if (random.random() < self.fault_rate
+                and (self.faulty_until is None or time() < self.faulty_until)):
+            # bit error on the bus after the I2CS computed its CRC8
+            result = str(nonce + 1) + result[len(str(nonce)):]
+        self.tx = result + "\n"
+        self.ready_at = time() + elapsed
+        self.jobs += 1
+
+    def request(self):
+        if self.tx and time() >= self.ready_at:
+            c, self.tx = self.tx[0], self.tx[1:]
+            return c
+        return "\n"
+
+
+class Adaptor:
+    """
+    Command loop of DuinoCoinUSBI2C_Adaptor.ino on the master side
+    of a pty
+    """
+    def __init__(self, args):
+        self.firmware = args.firmware
+        self.i2c_clock = args.i2c_clock
+        self.boot_baudrate = (None if args.baudrate == "auto"
+                              else int(args.baudrate))
+        self.max_baudrate = args.max_baudrate
+        # rate of the adaptor UART, None until the port is first used
+        self.rate = self.boot_baudrate
+        self.rate_prev = None
+        self.baud_since = None
+        self.slaves = {}
+        self.unplugged = {}
+        self.hotplug_events = sorted((time() + t, addr, plug)
+                                     for t, addr, plug in args.hotplug)
+        self.hashrate = args.hashrate
+        self.crc8_en = args.crc8 == "y"
+        faulty_until = (time() + args.faulty_for if args.faulty_for
+                        else None)
+        for i in range(args.slaves):
+            hashrate = args.hashrate * (1 + random.uniform(-args.jitter,
+                                                           args.jitter))
+            addr = args.first_addr + i
+            self.slaves[addr] = VirtualI2CS(addr, hashrate,
+                                            args.crc8 == "y",
+                                            args.faulty.get(addr, 0),
+                                            faulty_until)
+        self.master, self.slave_fd = os.openpty()
+        # raw until the miner sets the port up itself
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.buffer = b""
+        self.last_rx = 0
+        self.boot_time = args.boot_time
+        self.boot_until = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.commands = 0
+
+    def port_baudrate(self):
+        """
+        Rate the miner set the port to
+        """
+        if sys.platform.startswith("linux"):
+            buf = array.array("I", [0] * 64)
+            fcntl.ioctl(self.master, TCGETS2, buf)
+            # c_ospeed of struct termios2
+            return buf[10] or 115200
+        speed = termios.tcgetattr(self.master)[4]
+        for name in dir(termios):
+            if (name.startswith("B") and name[1:].isdigit()
+                    and getattr(termios, name) == speed):
+                return int(name[1:]) or 115200
+        # macOS keeps the rate itself
+        return speed or 115200
+
+    def link(self, data, rate):
+        """
+        What the other end receives of data sent at rate
+        """
+        if self.port_baudrate() != rate:
+            return bytes(random.getrandbits(8) for _ in data)
+        if rate > self.max_baudrate:
+            return bytes(b ^ 0x20 if random.random() < LINK_ERROR_RATE
+                         else b for b in data)
+        return data
+
+    def watchdog(self):
+        if (self.baud_since is not None
+                and time() - self.baud_since > BAUD_CONFIRM_TIMEOUT):
+            self.baud_since = None
+            self.rate = self.rate_prev
+            self.buffer = b""
+
+    def hotplug(self):
+        """
+        Applies the due --hotplug events, returns seconds until the next
+        """
+        while self.hotplug_events and self.hotplug_events[0][0] <= time():
+            _, addr, plug = self.hotplug_events.pop(0)
+            if plug and addr not in self.slaves:
+                self.slaves[addr] = self.unplugged.pop(
+                    addr, None) or VirtualI2CS(addr, self.hashrate,
+                                               self.crc8_en)
+            elif not plug and addr in self.slaves:
+                self.unplugged[addr] = self.slaves.pop(addr)
+            print(f"I2CS {'%x' % addr} {'plugged' if plug else 'unplugged'}",
+                  flush=True)
+        if self.hotplug_events:
+            return max(0, self.hotplug_events[0][0] - time())
+        return None
+
+    def serial_time(self, nbytes):
+        # 8N1, 10 bits per byte
+        return nbytes * 10 / (self.rate or self.port_baudrate())
+
+    def i2c_time(self, nbytes):
+        # address byte + data bytes, 9 clocks each
+        return (nbytes + 1) * 9 / self.i2c_clock
+
+    def run(self):
+        while True:
+            timeout = self.hotplug()
+            if self.baud_since is not None:
+                wait = max(0, self.baud_since + BAUD_CONFIRM_TIMEOUT - time())
+                timeout = wait if timeout is None else min(timeout, wait)
+            if not select.select([self.master], [], [], timeout)[0]:
+                self.watchdog()
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                # no process has the port open
+                sleep(0.1)
+                continue
+            self.watchdog()
+            if self.boot_until is None:
+                self.boot_until = time() + self.boot_time
+            if time() < self.boot_until:
+                # still in the bootloader
+                continue
+            if (self.buffer[:1] == bytes((BIN_SOF,))
+                    and time() - self.last_rx > BIN_TIMEOUT):
+                self.buffer = b""
+            self.last_rx = time()
+            if self.rate is None:
+                self.rate = self.port_baudrate()
+            self.bytes_in += len(data)
+            self.buffer += self.link(data, self.rate)
+            while True:
+                rate = self.rate
+                if (self.buffer[:1] == bytes((BIN_SOF,))
+                        and "bin" in CAPS.get(self.firmware, "")):
+                    if len(self.buffer) < BIN_HEADER:
+                        break
+                    if self.buffer[3] > BIN_PAYLOAD_MAX:
+                        # the adaptor drops the header and resyncs
+                        self.buffer = self.buffer[BIN_HEADER:]
+                        continue
+                    size = BIN_HEADER + self.buffer[3] + 1
+                    if len(self.buffer) < size:
+                        break
+                    frame = self.buffer[:size]
+                    self.buffer = self.buffer[size:]
+                    reply, i2c_bytes = self.frame(frame)
+                elif LINE_EOL in self.buffer:
+                    cmd, _, self.buffer = self.buffer.partition(LINE_EOL)
+                    # the adaptor keeps the first num_chars - 1 chars
+                    cmd = cmd[:NUM_CHARS - 1].decode(errors="replace")
+                    size = len(cmd) + 1
+                    reply, i2c_bytes = self.command(cmd)
+                    reply = reply.encode()
+                else:
+                    break
+                busy = self.serial_time(size)
+                busy += self.i2c_time(i2c_bytes) if i2c_bytes else 0
+                if reply:
+                    busy += self.serial_time(len(reply))
+                sleep(busy)
+                if reply:
+                    os.write(self.master, self.link(reply, rate))
+                    self.bytes_out += len(reply)
+                self.commands += 1
+
+    def frame(self, frame):
+        """
+        Binary frame, returns the reply frames and the number of
+        I2C bytes moved. Frames failing CRC8 are dropped
+        """
+        op = frame[1] & 0x0f
+        addr = frame[2]
+        length = frame[3]
+        payload = frame[BIN_HEADER:BIN_HEADER + length]
+        if (crc8(frame[1:BIN_HEADER + length]) != frame[-1]
+                or frame[1] >> 4 != BIN_VERSION or not 0 < addr <= 127):
+            return b"", 0
+        slave = self.slaves.get(addr)
+
+        if op == BIN_OP_WRITE:
+            if slave:
+                slave.receive(payload.decode(errors="replace"))
+            return b"", length
+        if op == BIN_OP_READ:
+            max_len = BIN_PAYLOAD_MAX
+            if length and 0 < payload[0] < max_len:
+                max_len = payload[0]
+            reply = b""
+            i2c_bytes = 0
+            for a in [addr] + [a for a in payload[1:] if 0 < a <= 127]:
+                data = self.burst(self.slaves.get(a), max_len).encode()
+                header = bytes((BIN_VERSION << 4 | BIN_OP_READ, a, len(data)))
+                reply += (bytes((BIN_SOF,)) + header + data
+                          + bytes((crc8(header + data),)))
+                i2c_bytes += len(data)
+            return reply, i2c_bytes
+        if op == BIN_OP_FLUSH:
+            for _ in range(FLUSH_READS):
+                if slave:
+                    slave.request()
+            return b"", FLUSH_READS
+        return b"", 0
+
+    def baud(self, arg):
+        """
+        bd:rate$ answers at the current rate then switches,
+        bd:ok$ confirms the switch before the watchdog reverts it
+        """
+        if arg == "ok":
+            self.baud_since = None
+            return "ok\n"
+        rate = atoi(arg)
+        if not BAUD_MIN <= rate <= BAUD_MAX:
+            return ""
+        if self.baud_since is None:
+            self.rate_prev = self.rate
+        self.rate = rate
+        self.baud_since = time()
+        # whatever arrived during the switch is garbage
+        self.buffer = b""
+        return f"bd:{rate}\n"
+
+    def burst(self, slave, max_len):
+        out = ""
+        for _ in range(max_len):
+            c = slave.request() if slave else "\n"
+            out += c
+            if c in "\n#":
+                break
+        return out
+
+    def command(self, cmd):
+        """
+        Returns the serial reply and the number of I2C bytes moved
+        """
+        # strtok() of the firmware skips empty fields
+        fields = [f for f in cmd.split(":") if f][:3]
+        if not fields:
+            return "", 0
+        op = fields[0]
+        rw = fields[1] if len(fields) > 1 else None
+        data = fields[2] if len(fields) > 2 else None
+
+        if op == "scn":
+            found = " ".join("%02X" % a for a in sorted(self.slaves))
+            reply = found + " \n" if found else "no I2CS detected\r\n"
+            return reply, 126
+        if op == "ver" and self.firmware in CAPS:
+            return f"{self.firmware}:{CAPS[self.firmware]}\n", 0
+        if op == "bd" and "bd" in CAPS.get(self.firmware, ""):
+            return self.baud(rw), 0
+        if op == "ec" and "bd" in CAPS.get(self.firmware, ""):
+            return (rw or "") + "\n", 0
+        if op == "clk" and "clk" in CAPS.get(self.firmware, ""):
+            if rw is not None and I2C_CLOCK_MIN <= atoi(rw) <= I2C_CLOCK_MAX:
+                self.i2c_clock = atoi(rw)
+            return f"clk:{self.i2c_clock}\n", 0
+        if op == "fl":
+            addr = atoi(data)
+            if not 0 < addr <= 127:
+                return "", 0
+            slave = self.slaves.get(addr)
+            for _ in range(FLUSH_READS):
+                if slave:
+                    slave.request()
+            return "", FLUSH_READS
+
+        if rw is None:
+            return "", 0
+        addr = atoi(op)
+        if not 0 < addr <= 127:
+            return "", 0
+        slave = self.slaves.get(addr)
+
+        if rw == "w" or (rw == "b" and "bw" in CAPS.get(self.firmware, "")):
+            if data is None:
+                return "", 0
+            if slave:
+                slave.receive(data)
+            return "", len(data)
+        if rw == "r":
+            c = slave.request() if slave else "\n"
+            return "%02X:%s$" % (addr, c), 1
+        if rw == "rn" and "br" in CAPS.get(self.firmware, ""):
+            max_len = atoi(data) if data is not None else BURST_MAX
+            if not 0 < max_len <= BURST_MAX:
+                max_len = BURST_MAX
+            out = self.burst(slave, max_len)
+            return "%02X:%s$" % (addr, out), len(out)
+        return "", 0
+
+
+def atoi(text):
+    digits = ""
+    for c in (text or "").strip():
+        if not c.isdigit():
+            break
+        digits += c
+    return int(digits or 0)
+
+
+def fault_rates(text):
+    # "9=0.5,10=1" with hex addresses like avrport of the miner
+    rates = {}
+    for item in text.split(","):
+        addr, _, rate = item.partition("=")
+        rates[int(addr, 16)] = float(rate or 1)
+    return rates
+
+
+def hotplug_events(text):
+    # "30:-9,60:+9" seconds after the start, + plugs and - unplugs
+    events = []
+    for item in text.split(","):
+        t, _, addr = item.partition(":")
+        events.append((float(t), int(addr[1:], 16), addr[0] == "+"))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="USBI2C adaptor simulator")
+    parser.add_argument("--slaves", type=int, default=1,
+                        help="number of virtual I2CS (1-126)")
+    parser.add_argument("--first-addr", type=int, default=8)
+    parser.add_argument("--hashrate", type=float, default=250,
+                        help="H/s of every I2CS")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="random +/- fraction of the hashrate per I2CS")
+    parser.add_argument("--crc8", choices=("y", "n"), default="y")
+    parser.add_argument("--firmware", default="0.7",
+                        help="adaptor firmware version to answer ver$ with")
+    parser.add_argument("--baudrate", default="auto",
+                        help="adaptor start rate, auto takes the rate the "
+                             "port is first opened with")
+    parser.add_argument("--max-baudrate", type=int, default=1000000,
+                        help="fastest rate the link is error free at")
+    parser.add_argument("--i2c-clock", type=int, default=100000,
+                        help="I2C clock the adaptor starts with")
+    parser.add_argument("--faulty", type=fault_rates, default={},
+                        help="hex I2CS address=fraction of results "
+                             "corrupted, comma separated")
+    parser.add_argument("--faulty-for", type=float, default=0,
+                        help="seconds the faulty I2CS misbehave, "
+                             "0 for good")
+    parser.add_argument("--hotplug", type=hotplug_events, default=[],
+                        help="seconds:+addr plugs and seconds:-addr "
+                             "unplugs an I2CS, comma separated")
+    parser.add_argument("--boot-time", type=float, default=0,
+                        help="seconds input is dropped after the port "
+                             "is first used")
+    parser.add_argument("--link", help="symlink to create for the port")
+    args = parser.parse_args()
+
+    if not 1 <= args.slaves or args.first_addr + args.slaves - 1 > 127:
+        parser.error("I2CS addresses must stay within 1-127")
+
+    adaptor = Adaptor(args)
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(adaptor.port, args.link)
+
+    def stop(signum, frame):
+        print(f"commands {adaptor.commands} bytes in {adaptor.bytes_in}"
+              f" out {adaptor.bytes_out} jobs "
+              f"{sum(s.jobs for s in adaptor.slaves.values())} bad jobs "
+              f"{sum(s.bad_jobs for s in adaptor.slaves.values())}",
+              flush=True)
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    addrs = sorted(adaptor.slaves)
+    print(f"USBI2C simulator {args.firmware} on {args.link or adaptor.port}"
+          f" with {len(addrs)} I2CS "
+          f"{','.join('%x' % a for a in addrs)}", flush=True)
+    adaptor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests of the pool emulator node protocol
+
+Usage:
+  python3 -m unittest discover -s Tools
+"""
+
+import argparse
+import os
+import socket
+import sys
+import unittest
+from threading import Thread
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import Pool_Emulator  # noqa: E402
+
+
+class NodeTest(unittest.TestCase):
+    def setUp(self):
+        self.node = Pool_Emulator.NodeServer(("127.0.0.1", 0),
+                                             Pool_Emulator.NodeHandler)
+        self.node.args = argparse.Namespace(
+            diff=8, latency=0, jitter=0, reject_rate=0, block_rate=0,
+            drop_rate=0)
+        self.node.stats = Pool_Emulator.Stats()
+        Thread(target=self.node.serve_forever, daemon=True).start()
+        self.s = socket.create_connection(self.node.server_address, 5)
+        self.assertEqual(self.recv(), Pool_Emulator.VERSION)
+
+    def tearDown(self):
+        self.s.close()
+        self.node.shutdown()
+        self.node.server_close()
+
+    def recv(self):
+        return self.s.recv(1024).decode().strip()
+
+    def share(self, nonce, hashrate):
+        self.s.sendall(b"JOB,user,AVR,key")
+        job = self.recv().split(",")
+        self.assertEqual(len(job), 3)
+        self.s.sendall(f"{nonce},{hashrate},USBI2C AVR Miner 4.1,"
+                       "None8,DUCOID0123456789ABCDEF".encode())
+        return self.recv()
+
+    def test_nonce_zero_is_good(self):
+        # the miner reports 0 H/s for a nonce 0 result
+        with mock.patch.object(Pool_Emulator.random, "randint",
+                               return_value=0):
+            self.assertEqual(self.share(0, 0.0), "GOOD")
+        self.assertEqual(self.node.stats.snapshot()["good"], 1)
+
+    def test_wrong_nonce_is_bad(self):
+        with mock.patch.object(Pool_Emulator.random, "randint",
+                               return_value=5):
+            self.assertEqual(self.share(6, 100.0), "BAD,Incorrect result")
+
+    def test_bad_hashrate_keeps_nonce(self):
+        with mock.patch.object(Pool_Emulator.random, "randint",
+                               return_value=5):
+            self.assertEqual(self.share(5, "nan?"), "GOOD")
+
+
+if __name__ == "__main__":
+    unittest.main()